@@ -8,4 +8,5 @@ __version_str__ = '.'.join(map(str, __version__))
 
 import query
 import adapter
-#from database import Database
+from database import Database
+from profiler import profile
@@ -1,5 +1,5 @@
 from base import Base
-from dbapi2 import DBAPI2
+from dbapi2 import DBAPI2, ConnectionPool, PoolError, MetadataCache
 from odbc import ODBC
 from rest import Rest
 
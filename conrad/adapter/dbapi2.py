@@ -1,12 +1,315 @@
 import logging
+import re
+import threading
+import time
 from abc import ABCMeta, abstractmethod, abstractproperty
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
 
+import pyodbc
+
+from conrad.dialect import Dialect
+from conrad.executor import Executor
+from conrad.hooks import Execution, Hooks, hooks as global_hooks
+from conrad.query import Insert
 from conrad.utils import plural
 from conrad.adapter import Base
 
 logger = logging.getLogger(__name__)
 
 
+# Matches the statements which write to a table, see DBAPI2.written_table().
+WRITE_STATEMENT = re.compile(
+        r'\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+([^\s(]+)', re.IGNORECASE)
+
+
+class PoolError(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of DBAPI2.0 connections. The pool opens connections
+    by calling factory(), and keeps between min_size and max_size of them
+    around. Connections are handed out by get() (or the checkout() context
+    manager), and handed back with put().
+
+        pool = ConnectionPool(lambda: pyodbc.connect(dsn), max_size=10)
+        with pool.checkout() as connection:
+            connection.cursor().execute('SELECT 1')
+
+    The pool pre-warms min_size connections when it is created, so the
+    first requests don't pay for the handshake. Connections which sit idle
+    for longer than idle_timeout seconds are closed, down to min_size.
+    Before an idle connection is handed out, it is checked with ping: if
+    ping is a SQL string it gets executed, otherwise a cursor is simply
+    opened and closed. Dead connections are thrown away and replaced.
+
+    If every connection is in use and the pool is at max_size, get() blocks
+    until one is returned, or raises PoolError after timeout seconds. The
+    time spent waiting is recorded, see stats. If on_close is given, it
+    is called with each connection the pool closes.
+    """
+
+    def __init__(self, factory, min_size=1, max_size=5, idle_timeout=300,
+                 timeout=None, ping=None, on_close=None):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError('pool sizes must satisfy 0 <= min <= max, max > 0')
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ping = ping
+        self.on_close = on_close
+        self.closed = False
+        self._idle = []
+        self._size = 0
+        self._lock = threading.Condition()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.prewarm()
+
+    def prewarm(self):
+        """
+        Opens connections until the pool holds at least min_size of them.
+        """
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self.factory()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            self.put(connection)
+
+    def get(self):
+        """
+        Checks a live connection out of the pool, opening a new one if
+        needed and allowed.
+        """
+        start = time.time()
+        waited = False
+        while True:
+            connection = None
+            with self._lock:
+                if self.closed:
+                    raise PoolError('Connection pool is closed')
+                self._evict()
+                if self._idle:
+                    connection = self._idle.pop()[0]
+                elif self._size < self.max_size:
+                    self._size += 1
+                else:
+                    remaining = None
+                    if self.timeout is not None:
+                        remaining = self.timeout - (time.time() - start)
+                        if remaining <= 0:
+                            raise PoolError(
+                                'Timed out waiting for a connection after '
+                                '{}s'.format(self.timeout))
+                    waited = True
+                    self._lock.wait(remaining)
+                    continue
+            if connection is None:
+                try:
+                    connection = self.factory()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self.alive(connection):
+                self._discard(connection)
+                continue
+            self._record(time.time() - start, waited)
+            return connection
+
+    def put(self, connection):
+        """
+        Returns a connection to the pool. Anything left open on it is
+        rolled back first, so an idle connection holds no transaction or
+        locks; a connection which fails to roll back is thrown away.
+        """
+        try:
+            connection.rollback()
+        except Exception, e:
+            logger.info('Discarding pooled connection which failed to '
+                        'roll back: {}'.format(e))
+            self._discard(connection)
+            return
+        with self._lock:
+            if self.closed:
+                self._size -= 1
+                self._close(connection)
+            else:
+                self._idle.append((connection, time.time()))
+            self._lock.notify()
+
+    @contextmanager
+    def checkout(self):
+        connection = self.get()
+        try:
+            yield connection
+        finally:
+            self.put(connection)
+
+    def alive(self, connection):
+        """
+        Returns True if the connection still works.
+        """
+        try:
+            cursor = connection.cursor()
+            if self.ping:
+                cursor.execute(self.ping)
+            cursor.close()
+            return True
+        except Exception, e:
+            logger.info('Discarding dead pooled connection: {}'.format(e))
+            return False
+
+    def close(self):
+        """
+        Closes every idle connection. Connections which are checked out
+        get closed when they are returned.
+        """
+        with self._lock:
+            self.closed = True
+            for connection, last_used in self._idle:
+                self._size -= 1
+                self._close(connection)
+            self._idle = []
+            self._lock.notify_all()
+
+    @property
+    def stats(self):
+        """
+        Returns a dict of pool statistics. wait_time is the total number of
+        seconds spent in get(), and waits the number of checkouts which had
+        to block because the pool was exhausted.
+        """
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'max_wait': self.max_wait,
+                'avg_wait': self.wait_time / self.checkouts if self.checkouts else 0.0,
+            }
+
+    def _record(self, wait, waited):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+            if waited:
+                self.waits += 1
+
+    def _evict(self):
+        # Called with the lock held. The idle list is ordered oldest first.
+        if self.idle_timeout is None:
+            return
+        cutoff = time.time() - self.idle_timeout
+        while (self._idle and self._size > self.min_size
+                and self._idle[0][1] < cutoff):
+            connection = self._idle.pop(0)[0]
+            self._size -= 1
+            self._close(connection)
+
+    def _discard(self, connection):
+        self._close(connection)
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _close(self, connection):
+        if self.on_close is not None:
+            self.on_close(connection)
+        try:
+            connection.close()
+        except Exception, e:
+            logger.debug('Error while closing connection: {}'.format(e))
+
+
+class MetadataCache(object):
+    """
+    Caches the results of catalog calls (primary keys, columns, foreign
+    keys) per table, so that they are only made once. Entries are keyed on
+    the table name plus the kind of lookup. If ttl is set, entries older
+    than ttl seconds are loaded again on their next use.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get(self, table, kind, loader):
+        """
+        Returns the cached value for (table, kind), calling loader() to
+        fill it in if it is missing or expired.
+        """
+        key = (table, kind)
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded = entry
+            if self.ttl is None or time.time() - loaded < self.ttl:
+                return value
+        value = loader()
+        self._entries[key] = (value, time.time())
+        return value
+
+    def peek(self, table, kind):
+        """
+        Returns the cached value for (table, kind), or None if it is
+        missing or expired. Unlike get(), this never loads anything.
+        """
+        entry = self._entries.get((table, kind))
+        if entry is not None:
+            value, loaded = entry
+            if self.ttl is None or time.time() - loaded < self.ttl:
+                return value
+        return None
+
+    def dump(self):
+        """
+        Returns every entry as a list of [table, kind, value] lists, which
+        can be serialized (e.g. as JSON) and handed back to load().
+        """
+        return [[table, kind, value]
+                for (table, kind), (value, loaded) in self._entries.items()]
+
+    def load(self, entries):
+        """
+        Fills the cache with entries, as returned by dump().
+        """
+        now = time.time()
+        for table, kind, value in entries:
+            if isinstance(kind, list):
+                kind = tuple(kind)
+            self._entries[(table, kind)] = (value, now)
+
+    def invalidate(self, table=None):
+        """
+        Drops every entry for table, or all entries if table is None.
+        """
+        if table is None:
+            self._entries.clear()
+        else:
+            for key in self._entries.keys():
+                if key[0] == table:
+                    del self._entries[key]
+
+
 class DBAPI2(Base):
     """
     This is a base DB adapter, for a database which implements the
@@ -14,37 +317,550 @@ class DBAPI2(Base):
     as it currently has only been tested with the ODBC subclass. In theory,
     though, you should be able to create your own adapter by subclassing
     this, and defining the connect() method for whatever database you
-    are trying to connect to. Just have it set self.cursor and
-    self.connection, and you should be good to go. You can override
+    are trying to connect to. Just have it set self.connection (or
+    self.pool, a ConnectionPool), and you should be good to go. You can override
     any of the other methods if your database is non-standard or
     if the module doesn't fully implement DBAPI2.0.
     """
 
     __metaclass__ = ABCMeta
 
-    placeholder = '?'
+    # The SQL dialect of the database, see conrad.dialect. Set by
+    # connect() or __init__().
+    dialect = None
+    pool = None
+    # Opens a new connection; set by connect(). Used by the pool, and by
+    # pin() for the executor's workers.
+    connection_factory = None
+    result_cache = None
+    autocommit = False
+    arraysize = 1000
+    executor_workers = 4
+    statement_cache_size = 32
+    metadata_ttl = None
+    # The most placeholders one statement may use, e.g. in an IN (...)
+    # list. Lower it for databases with a tighter limit.
+    max_parameters = 999
+    _metadata = None
+
+    def __init__(self, *args, **kwargs):
+        if self.dialect is None:
+            self.dialect = Dialect()
+        self.hooks = Hooks()
+        self._local = threading.local()
+        self._cursors = {}
+        self._cursors_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        Base.__init__(self, *args, **kwargs)
+
+    @property
+    def placeholder(self):
+        return self.dialect.placeholder
+
+    @property
+    def executor(self):
+        """
+        The Executor used by submit(). It runs executor_workers threads,
+        each of which opens its own connection (see pin()) and keeps it for
+        as long as it lives.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = Executor(self.executor_workers,
+                        initializer=self.pin, finalizer=self.unpin)
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the adapter's executor, and returns a
+        Future for its result. Use this to keep blocking database work off
+        of an event loop thread: no matter how many calls are submitted,
+        at most executor_workers of them hit the database at once, each on
+        its own connection. Sessions and transactions are per thread, so
+        they don't carry over into the submitted call. The workers' own
+        connections are opened outside of the pool, so they never compete
+        with other threads for pooled connections.
+        """
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the executor, if it was started, closing the workers'
+        connections.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait)
+
+    def pin(self):
+        """
+        Opens a dedicated connection with connection_factory, and uses it
+        for everything the current thread does until unpin() is called.
+        """
+        if getattr(self._local, 'pinned', None) is None:
+            if self.connection_factory is None:
+                raise Exception('Adapter is not connected')
+            self._local.pinned = self.connection_factory()
+
+    def unpin(self):
+        """
+        Closes the connection opened by pin().
+        """
+        connection = getattr(self._local, 'pinned', None)
+        if connection is not None:
+            self._local.pinned = None
+            self.close_cursors(connection)
+            try:
+                connection.close()
+            except Exception, e:
+                logger.info('Error closing pinned connection: {}'.format(e))
+
+    @property
+    def metadata(self):
+        """
+        The MetadataCache holding this adapter's catalog lookups. Its ttl
+        defaults to metadata_ttl, i.e. entries never expire.
+        """
+        if self._metadata is None:
+            self._metadata = MetadataCache(self.metadata_ttl)
+        return self._metadata
+
+    @property
+    def connected(self):
+        return self.pool is not None or hasattr(self, 'connection')
+
+    @property
+    def in_transaction(self):
+        """
+        True if the current thread is inside of a transaction() block.
+        """
+        return getattr(self._local, 'connection', None) is not None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the statements in the with block as one transaction:
+
+            with adapter.transaction():
+                adapter.execute('UPDATE ...')
+                adapter.execute('INSERT ...')
+
+        All statements executed on this thread inside of the block share
+        one connection, and are committed once when the block exits, or
+        rolled back if it raises. Errors from statements inside of the
+        block are raised, instead of being logged and swallowed.
+
+        Blocks can be nested. If the dialect supports_savepoints, a nested
+        block is wrapped in a savepoint, and an error inside of it only
+        rolls back to that savepoint. Otherwise, it simply joins the
+        outer transaction.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                if self.dialect.supports_savepoints:
+                    with self._savepoint('conrad_sp_{}'.format(depth)):
+                        yield self._local.connection
+                else:
+                    yield self._local.connection
+            finally:
+                self._local.depth = depth
+            return
+        with self.checkout() as connection:
+            autocommit = getattr(connection, 'autocommit', False)
+            if autocommit:
+                connection.autocommit = False
+            self._local.connection = connection
+            self._local.depth = 1
+            self._local.written = set()
+            try:
+                yield connection
+                connection.commit()
+                if self.result_cache is not None:
+                    for table in self._local.written:
+                        self.result_cache.invalidate(table)
+            except:
+                connection.rollback()
+                raise
+            finally:
+                self._local.connection = None
+                self._local.depth = 0
+                self._local.written = None
+                if autocommit:
+                    connection.autocommit = True
+
+    @contextmanager
+    def _savepoint(self, name):
+        dialect = self.dialect
+        cursor = self._local.connection.cursor()
+        try:
+            cursor.execute(dialect.savepoint_statement.format(name))
+            try:
+                yield
+            except:
+                cursor.execute(dialect.rollback_savepoint_statement.format(name))
+                raise
+            if dialect.release_savepoint_statement:
+                cursor.execute(dialect.release_savepoint_statement.format(name))
+        finally:
+            cursor.close()
+
+    def _commit(self, connection, sql):
+        """
+        Commits after a write outside of a transaction(), unless the
+        adapter is in autocommit mode, and drops the cached results of the
+        table sql wrote to. Inside of a transaction(), the results are only
+        dropped once it commits, so other threads can't cache the old rows
+        again in between.
+        """
+        if not (self.autocommit or self.in_transaction):
+            connection.commit()
+        if self.result_cache is None:
+            return
+        table = self.written_table(sql)
+        if self.in_transaction:
+            self._local.written.add(table)
+        else:
+            self.result_cache.invalidate(table)
+
+    @staticmethod
+    def written_table(sql):
+        """
+        Returns the unquoted name of the table written to by an INSERT,
+        UPDATE or DELETE, or None if sql is anything else.
+        """
+        match = WRITE_STATEMENT.match(sql)
+        if match is None:
+            return None
+        return match.group(1).split('.')[-1].strip('"[]`')
+
+    def invalidate(self, table=None):
+        """
+        Drops the cached metadata for table, or for every table. Call this
+        after altering the schema outside of conrad.
+        """
+        self.metadata.invalidate(table)
+
+    @contextmanager
+    def checkout(self):
+        """
+        Yields the connection to use for one statement. If the adapter has
+        a ConnectionPool, the connection is checked out of it, and returned
+        afterwards. Otherwise, this is just self.connection. Inside of a
+        transaction(), this is always the transaction's connection, and on
+        a pinned thread, the pinned connection.
+
+        While a thread holds a connection (e.g. for an open stream()),
+        nested checkouts on that thread share it instead of taking another
+        one from the pool, so queries run inside of a loop over a result
+        can't exhaust it. Once the last of them is done with the
+        connection, whatever the driver still has open is rolled back
+        (unless the adapter is in autocommit mode; writes outside of a
+        transaction() are already committed), so reads don't keep a
+        transaction and its locks open, and a pooled connection goes back
+        to the pool.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            yield connection
+            return
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            connection = getattr(self._local, 'pinned', None)
+            pooled = connection is None and self.pool is not None
+            if pooled:
+                connection = self.pool.get()
+            elif connection is None:
+                connection = self.connection
+            held = self._local.held = [connection, 0, pooled]
+        held[1] += 1
+        try:
+            yield held[0]
+        finally:
+            held[1] -= 1
+            if not held[1]:
+                self._local.held = None
+                connection, count, pooled = held
+                if pooled:
+                    self.pool.put(connection)
+                elif not self.autocommit:
+                    try:
+                        connection.rollback()
+                    except pyodbc.Error, e:
+                        logger.info('Error rolling back: {}'.format(e))
 
     def execute(self, sql, *args):
         """
         This executes the given SQL string, passing in the remaining args.
-        If the statement is a SELECT, return the results. If it is an
-        INSERT, return the pk of created item. If it is an UPDATE or
-        a DELETE, return None.
+        If the statement returns rows (e.g. a SELECT), return them.
+        Otherwise (e.g. an INSERT, UPDATE or DELETE), return the number of
+        affected rows, as reported by cursor.rowcount.
+
+        Writes are committed right away, unless they are made inside of a
+        transaction() or the adapter is in autocommit mode. SELECTs are
+        never committed.
+
+        The cursor is kept around afterwards (up to statement_cache_size
+        per connection), and reused the next time the same SQL is run on
+        the same connection, so the driver can reuse its prepared plan.
+
+        The adapter's hooks run around the statement, see conrad.hooks.
         """
-        logger.info('Executing SQL query "{}" with args "{}"'.format(
-                sql, args))
-        cursor = self.connection.cursor()
         result = []
-        try:
-            cursor.execute(sql, *args)
-            self.connection.commit()
-            result = cursor.fetchall()
-        except Exception, e:
-            logger.debug('Error while executing SQL statement: {}'.format(e))
-        finally:
+        with self.checkout() as connection:
+            execution = self._before(connection, sql, args)
+            cursor = self._cursor(connection, sql)
+            try:
+                cursor.execute(sql, *args)
+                if cursor.description is not None:
+                    result = cursor.fetchall()
+                else:
+                    result = cursor.rowcount
+                if not self.is_read(sql):
+                    self._commit(connection, sql)
+                if execution is not None:
+                    self._after(execution, cursor, len(result)
+                                if cursor.description is not None else 0)
+            except Exception, e:
+                logger.debug('Error while executing SQL statement: %s', e)
+                if execution is not None:
+                    self._error(execution, e)
+                cursor.close()
+                cursor = None
+                if self.in_transaction:
+                    raise
+            finally:
+                self._release_cursor(connection, sql, cursor)
+        return result
+
+    def _before(self, connection, sql, args, many=False):
+        # Returns the Execution passed to the hooks, after running the
+        # before_execute hooks, or None if there are no hooks at all.
+        if not (self.hooks.active or global_hooks.active):
+            return None
+        execution = Execution(self, connection, sql, args, many)
+        self._fire('before_execute', execution)
+        execution.started = default_timer()
+        return execution
+
+    def _after(self, execution, cursor, rows):
+        execution.duration = default_timer() - execution.started
+        execution.rows = rows
+        execution.rowcount = getattr(cursor, 'rowcount', None)
+        self._fire('after_execute', execution)
+
+    def _error(self, execution, error):
+        execution.duration = default_timer() - execution.started
+        execution.error = error
+        self._fire('on_error', execution)
+
+    def _fire(self, event, execution):
+        self.hooks.fire(event, execution)
+        global_hooks.fire(event, execution)
+
+    def _cursor(self, connection, sql):
+        # Returns a cursor which last ran sql on connection, if there is
+        # one, so that the driver can reuse its prepared statement. The
+        # cursor is taken out of the cache while it is in use, so that two
+        # threads sharing a connection never get the same cursor.
+        with self._cursors_lock:
+            entry = self._cursors.get(id(connection))
+            if entry is not None and entry[0] is connection:
+                cursor = entry[1].pop(sql, None)
+                if cursor is not None:
+                    return cursor
+        return connection.cursor()
+
+    def _release_cursor(self, connection, sql, cursor):
+        if cursor is None:
+            return
+        if not self.statement_cache_size:
             cursor.close()
+            return
+        with self._cursors_lock:
+            entry = self._cursors.get(id(connection))
+            if entry is None or entry[0] is not connection:
+                entry = self._cursors[id(connection)] = (connection, OrderedDict())
+            cursors = entry[1]
+            old = cursors.pop(sql, None)
+            cursors[sql] = cursor
+            if len(cursors) > self.statement_cache_size:
+                old = cursors.popitem(last=False)[1]
+        if old is not None:
+            old.close()
+
+    def close_cursors(self, connection):
+        """
+        Closes the cached cursors of connection, and forgets about them.
+        This is called when a pooled connection is closed.
+        """
+        with self._cursors_lock:
+            entry = self._cursors.pop(id(connection), None)
+        if entry is not None and entry[0] is connection:
+            for cursor in entry[1].values():
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    @staticmethod
+    def is_read(sql):
+        """
+        Returns True if sql is a plain SELECT, which doesn't need a commit.
+        """
+        return sql.lstrip()[:6].upper() == 'SELECT'
+
+    def executemany(self, sql, seq_of_args, returning=False, pk=None):
+        """
+        Executes the given SQL statement once for each sequence of args in
+        seq_of_args, on one cursor, and commits once. Uses pyodbc's
+        fast_executemany when the cursor supports it, which sends all of
+        the parameter sets in a single round trip. Returns the number of
+        rows affected.
+
+        If returning is True, the statement is run row by row instead, and
+        the list of generated keys is returned. Insert.execute() only does
+        this for key styles which can't return rows; the others use
+        multi-row INSERTs. The statement must then be
+        an INSERT built for the dialect's insert_key_style, see insert(); pk
+        is the name of the key column.
+        """
+        with self.checkout() as connection:
+            execution = self._before(connection, sql, seq_of_args, many=True)
+            cursor = connection.cursor()
+            try:
+                if returning:
+                    result = []
+                    for args in seq_of_args:
+                        cursor.execute(sql, *args)
+                        result.append(self._inserted(cursor, pk)[0])
+                else:
+                    if hasattr(cursor, 'fast_executemany'):
+                        cursor.fast_executemany = True
+                    cursor.executemany(sql, seq_of_args)
+                    result = cursor.rowcount
+                    if result is None or result < 0:
+                        result = len(seq_of_args)
+                self._commit(connection, sql)
+                if execution is not None:
+                    self._after(execution, cursor, 0)
+            except Exception, e:
+                logger.error('Error while executing SQL statement: %s', e)
+                if execution is not None:
+                    self._error(execution, e)
+                if not self.in_transaction:
+                    connection.rollback()
+                raise
+            finally:
+                cursor.close()
         return result
 
+    def insert(self, sql, args, pk=None):
+        """
+        Runs sql, an INSERT built for the dialect's insert_key_style (see
+        Insert), with args, and returns (key, row): the generated key of the
+        new row, and for the returning and output styles, the row as it was
+        stored (None otherwise). pk is the name of the key column, used to
+        find the key in that row. The key is read back on the same cursor,
+        and the insert is committed once. The styles are:
+
+            'lastrowid'       cursor.lastrowid, for drivers which have it,
+                              falling back to 'query' otherwise
+            'returning'       INSERT ... RETURNING *
+            'output'          INSERT ... OUTPUT INSERTED.* VALUES ...
+            'scope_identity'  INSERT ...; SELECT SCOPE_IDENTITY(), one batch
+            'query'           the dialect's last_inserted_statement, or no
+                              key if it has none
+        """
+        with self.checkout() as connection:
+            execution = self._before(connection, sql, args)
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql, *args)
+                result = self._inserted(cursor, pk)
+                self._commit(connection, sql)
+                if execution is not None:
+                    self._after(execution, cursor, int(result[1] is not None))
+            except Exception, e:
+                logger.error('Error while executing SQL statement: %s', e)
+                if execution is not None:
+                    self._error(execution, e)
+                if not self.in_transaction:
+                    connection.rollback()
+                raise
+            finally:
+                cursor.close()
+        return result
+
+    def _inserted(self, cursor, pk):
+        # Reads the (key, row) of the row cursor just inserted.
+        style = self.dialect.insert_key_style
+        if style in ('returning', 'output'):
+            row = cursor.fetchone()
+            names = [d[0] for d in cursor.description]
+            return row[names.index(pk) if pk in names else 0], row
+        if style == 'lastrowid':
+            # pyodbc cursors don't have lastrowid; other DBAPI2 drivers'
+            # do, but may leave it None.
+            key = getattr(cursor, 'lastrowid', None)
+            if key is not None:
+                return key, None
+        if style == 'scope_identity':
+            while cursor.description is None and cursor.nextset():
+                pass
+        elif self.last_inserted_statement:
+            cursor.execute(self.last_inserted_statement)
+        else:
+            return None, None
+        return cursor.fetchone()[0], None
+
+    def stream(self, sql, *args, **kwargs):
+        """
+        Like execute(), but for SELECTs: this is a generator which yields
+        the result rows as they are fetched, instead of returning a list.
+        Rows are pulled from the cursor in batches of arraysize (which
+        defaults to self.arraysize), and the cursor and its connection are
+        held until the generator is exhausted or closed, so only one batch
+        is ever in memory.
+        """
+        arraysize = kwargs.get('arraysize') or self.arraysize
+        with self.checkout() as connection:
+            execution = self._before(connection, sql, args)
+            cursor = connection.cursor()
+            count = 0
+            try:
+                try:
+                    cursor.execute(sql, *args)
+                except Exception, e:
+                    logger.debug('Error while executing SQL statement: %s', e)
+                    if execution is not None:
+                        self._error(execution, e)
+                        execution = None
+                    return
+                cursor.arraysize = arraysize
+                while True:
+                    try:
+                        rows = cursor.fetchmany(arraysize)
+                    except Exception, e:
+                        if execution is not None:
+                            execution.rows = count
+                            self._error(execution, e)
+                            execution = None
+                        raise
+                    if not rows:
+                        break
+                    count += len(rows)
+                    for row in rows:
+                        yield row
+            finally:
+                # Also reached when the generator is closed early.
+                if execution is not None:
+                    self._after(execution, cursor, count)
+                cursor.close()
+
     def find(self, resource, conditions={}, columns=[],
                 order_by=None, limit=None):
         table = self.escape(resource)
@@ -66,62 +882,63 @@ class DBAPI2(Base):
             order_by_clause = 'ORDER BY {}'.format(self.escape(order_by))
         else:
             order_by_clause = ''
+        offset, count = 0, None
         if limit:
             if isinstance(limit, (int, long)):
-                limit_clause = 'LIMIT {}'.format(limit)
+                count = limit
             elif isinstance(limit, tuple):
-                limit_clause = 'LIMIT {} {}'.format(*limit)
+                offset, count = limit
             else:
                 raise ValueError('limit must be int or tuple')
-        else:
-            limit_clause = ''
-        sql = 'SELECT {} FROM {} {} {} {}'.format(
-                columns, self.escape(table), where_clause,
-                order_by_clause, limit_clause).strip()
+        sql = self.dialect.select(
+                'SELECT {select} FROM {table} {conditions} {order} {limit}',
+                {'select': columns, 'table': self.escape(table),
+                 'conditions': where_clause, 'order': order_by_clause},
+                offset, count)
         res = self.execute(sql, *cmd_args)
         if res:
-            logger.debug('Got command result: {}'.format(res))
             return [self.result_dict(r) for r in res]
         else:
             return []
 
     def create(self, table, arguments={}):
         logger.debug('Creating {} with {}'.format(table, arguments))
-        table = self.escape(table)
-        if arguments:
-            sql_args = []
-            columns = []
-            for k, v in arguments.items():
-                columns.append("'{}'".format(k))
-                sql_args.append(v)
-            args_clause = '({}) VALUES ({})'.format(
-                ', '.join(columns),
-                ', '.join([self.placeholder for c in columns]))
-        else:
+        if not arguments:
             raise Exception('Must specify arguments for create')
-        sql = 'INSERT INTO {} {}'.format(
-            table, args_clause)
-        logger.debug('raw SQL query: {}'.format(sql))
-        self.execute(sql, sql_args)
-        lastid = self.get_inserted_id(table)
-        res = self.find(table, conditions={self.pk(table):lastid})
-        return res
+        pk = self.pk(table)
+        q = Insert(self.escape(table), **arguments)
+        q.dialect = self.dialect
+        q.key_style = self.dialect.insert_key_style
+        key, row = self.insert(q.statement, q.variables, pk)
+        if row is not None:
+            return [self.result_dict(row)]
+        if key is None:
+            raise Exception('Cannot read back the row inserted into {}: '
+                            'no key was returned'.format(table))
+        return self.find(table, conditions={pk:key})
 
 
     def update(self, table, arguments={}, conditions={}):
         table = self.escape(table)
-
+        if not arguments:
+            raise Exception('Must specify arguments for update')
+        columns = arguments.keys()
+        set_clause = ', '.join(['{} = {}'.format(self.escape(c), self.placeholder)
+                                for c in columns])
+        where, args = self._generate_where(conditions)
+        sql = 'UPDATE {} SET {} {}'.format(table, set_clause, where).strip()
+        return self.execute(sql, *([arguments[c] for c in columns] + args))
 
     def delete(self, table, conditions={}):
         table = self.escape(table)
         where, args = self._generate_where(conditions)
         sql = 'DELETE FROM {} {}'.format(
-                table, where)
-        self.execute(sql, args)
+                table, where).strip()
+        return self.execute(sql, *args)
 
     def _generate_where(self, conditions):
         if not conditions:
-            return ''
+            return '', []
         attrs = []
         args = []
         for k, v in conditions.items():
@@ -131,8 +948,7 @@ class DBAPI2(Base):
         return sql, args
 
     def get_inserted_id(self, table):
-        sql = 'SELECT last_insert_rowid() as lastid'
-        res = self.execute(sql)
+        res = self.execute(self.last_inserted_statement)
         logger.debug('found upserted id: {}'.format(res[0][0]))
         return res[0][0]
 
@@ -142,11 +958,8 @@ class DBAPI2(Base):
         Takes DBAPI2.0 Row object, and turns them into a list of dicts
         consisting of column:value pairs.
         """
-        logger.debug('Converting {} to dict'.format(row))
         try:
-            d = dict(zip([r[0] for r in row.cursor_description], row))
-            logger.debug('Converted to dict: {}'.format(d))
-            return d
+            return dict(zip([r[0] for r in row.cursor_description], row))
         except AttributeError, e:
             logger.error('Could not convert row to dict: {} ({})'.format(
                 row, type(row)))
@@ -155,10 +968,10 @@ class DBAPI2(Base):
     @property
     def last_inserted_statement(self):
         """
-        Override this in your subclass if your target database uses some
-        other statement to retreive the ID of the last inserted item.
+        The statement which retrieves the ID of the last inserted item, as
+        given by the dialect.
         """
-        return 'SELECT last_insert_rowid() AS last_insert_rowid'
+        return self.dialect.last_inserted_statement
 
     @property
     def tables(self):
@@ -173,36 +986,71 @@ class DBAPI2(Base):
                 type: usually TABLE or VIEW,
                 remarks: DB dependent
             }
+
+        The listing is cached, see metadata.
         """
+        return self.metadata.get(None, 'tables', self._tables)
+
+    def _tables(self):
         logger.debug('Returning table listing for {}'.format(self))
-        tables = {}
-        cursor = self.connection.cursor()
-        for row in cursor.tables():
-            # The following hacks are due to the fact that pyodbc returns
-            # None if the DB doesn't have a catalog or schema, but it
-            # doesn't accept None when calling cursor.columns() or
-            # cursor.tables(). So, change None to empty string.
-            if row.table_schem:
-                name = '{}.{}'.format(row.table_schem, row.table_name)
-                schema = row.table_schem
-            else:
-                name = row.table_name
-                schema = ''
-            if row.table_cat:
-                catalog = row.table_cat
-            else:
-                catalog = ''
-            tables[name] = {
-                'name': row.table_name,
-                'catalog': catalog,
-                'schema': schema,
-                'type': row.table_type,
-                'remarks': row.remarks
-            }
+        with self.checkout() as connection:
+            cursor = connection.cursor()
+            rows = cursor.tables().fetchall()
+            cursor.close()
+        tables = dict(self._table_entry(row) for row in rows)
         logger.debug('Raw tables: {}'.format(tables))
-        cursor.close()
         return tables
 
+    def table_info(self, name):
+        """
+        Returns the entry from tables for just the named table (which may
+        be given as schema.table), or None if there is no such table. This
+        only asks the catalog about the one table, so it is much cheaper
+        than tables on databases with many of them. If the full listing is
+        already cached (e.g. from a snapshot), the entry is taken from it.
+        """
+        tables = self.metadata.peek(None, 'tables')
+        if tables is not None and name in tables:
+            return tables[name]
+        return self.metadata.get(name, 'info', lambda: self._table_info(name))
+
+    def _table_info(self, name):
+        criteria = {'table': name}
+        if '.' in name:
+            criteria['schema'], criteria['table'] = name.split('.', 1)
+        with self.checkout() as connection:
+            cursor = connection.cursor()
+            rows = cursor.tables(**criteria).fetchall()
+            cursor.close()
+        for row in rows:
+            key, info = self._table_entry(row)
+            if key == name:
+                return info
+        return None
+
+    def _table_entry(self, row):
+        # The following hacks are due to the fact that pyodbc returns
+        # None if the DB doesn't have a catalog or schema, but it
+        # doesn't accept None when calling cursor.columns() or
+        # cursor.tables(). So, change None to empty string.
+        if row.table_schem:
+            name = '{}.{}'.format(row.table_schem, row.table_name)
+            schema = row.table_schem
+        else:
+            name = row.table_name
+            schema = ''
+        if row.table_cat:
+            catalog = row.table_cat
+        else:
+            catalog = ''
+        return name, {
+            'name': row.table_name,
+            'catalog': catalog,
+            'schema': schema,
+            'type': row.table_type,
+            'remarks': row.remarks
+        }
+
     def describe(self, table, catalog='', schema=''):
         """
         Returns a description of the requested table. Description is a
@@ -218,11 +1066,21 @@ class DBAPI2(Base):
                 nullable: 1 if null ok,
                 remarks: db dependent
             }
+
+        The description is cached, see metadata.
         """
+        return self.metadata.get(table, ('columns', catalog, schema),
+                lambda: self._describe(table, catalog, schema))
+
+    def _describe(self, table, catalog, schema):
         logger.debug('Describing table: {}'.format(table))
         columns = {}
         try:
-            for row in self.cursor.columns(table, catalog, schema):
+            with self.checkout() as connection:
+                cursor = connection.cursor()
+                rows = cursor.columns(table, catalog, schema).fetchall()
+                cursor.close()
+            for row in rows:
                 if row.table_schem:
                     table_schema = row.table_schem
                 else:
@@ -250,19 +1108,23 @@ class DBAPI2(Base):
         """
         Escape the supplied string, in a format supported by this DB.
         """
-        logger.debug('Escaping string: {}'.format(string))
-        return string
+        return self.dialect.escape(string)
 
     def pk(self, table):
         """
         Returns the name of the primary key field in the given table. If
-        multiple PKs are present, returns the first.
+        multiple PKs are present, returns the first. The result is cached,
+        see metadata.
         """
+        return self.metadata.get(table, 'pk', lambda: self._pk(table))
+
+    def _pk(self, table):
         logger.debug('Fetching primary keys for table {}'.format(table))
-        cursor = self.connection.cursor()
-        cursor.primaryKeys(table)
-        all_pks = cursor.fetchall()
-        cursor.close()
+        with self.checkout() as connection:
+            cursor = connection.cursor()
+            cursor.primaryKeys(table)
+            all_pks = cursor.fetchall()
+            cursor.close()
         logger.debug('Found all PKs: {}'.format(all_pks))
         logger.debug('Using PK: {}'.format(all_pks[0][3]))
         return all_pks[0][3]
@@ -277,14 +1139,49 @@ class DBAPI2(Base):
             }
 
         For convenience, this also sets a key plural(to_table) to ease
-        lookup of pluralized relations in the models.
+        lookup of pluralized relations in the models. The result is cached,
+        see metadata.
         """
+        return self.metadata.get(table, 'fks', lambda: self._fks(table))
+
+    def _fks(self, table):
         logger.debug('Fetching foreign keys for table {}'.format(table))
-        self.cursor.foreignKeys(table)
+        with self.checkout() as connection:
+            cursor = connection.cursor()
+            cursor.foreignKeys(table)
+            rows = cursor.fetchall()
+            cursor.close()
         fk_list = {}
-        for fk in self.cursor.fetchall():
+        for fk in rows:
             logger.debug('Scanning and appending raw fk: {}'.format(fk))
             fk_list[fk[6]] = {'to':(fk[6], fk[7]), 'from':(fk[2], fk[3])}
             fk_list[plural(fk[6])] = fk_list[fk[6]]
         logger.info('Final FK list: {}'.format(fk_list))
         return fk_list
+
+    def references(self, table):
+        """
+        Returns a dict of the foreign keys in table which point at other
+        tables, the reverse of fks():
+
+            to_table:{
+                to: (to_table, colname),
+                from: (table, colname)
+            }
+
+        The result is cached, see metadata.
+        """
+        return self.metadata.get(table, 'references',
+                                 lambda: self._references(table))
+
+    def _references(self, table):
+        logger.debug('Fetching references for table {}'.format(table))
+        with self.checkout() as connection:
+            cursor = connection.cursor()
+            cursor.foreignKeys(foreignTable=table)
+            rows = cursor.fetchall()
+            cursor.close()
+        references = {}
+        for fk in rows:
+            references[fk[2]] = {'to':(fk[2], fk[3]), 'from':(fk[6], fk[7])}
+        return references
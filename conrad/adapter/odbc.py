@@ -3,15 +3,54 @@ import pyodbc
 
 logger = logging.getLogger(__name__)
 
-from dbapi2 import DBAPI2
+from conrad.dialect import detect
+from dbapi2 import DBAPI2, ConnectionPool
 
 class ODBC(DBAPI2):
     """
     This is a generic PyODBC based adapter.
+
+    Pass pool_size to share a ConnectionPool of up to that many connections
+    between threads, instead of a single connection. pool_min connections
+    are opened up front; the other pool_* arguments are passed on to the
+    ConnectionPool.
+
+    With autocommit=True, the driver commits every statement itself, and
+    conrad never calls commit() outside of a transaction(). Otherwise,
+    conrad commits each write made outside of a transaction(), and rolls
+    back after reads, so they don't keep a transaction (and its locks)
+    open.
+
+    The SQL dialect is picked from the DBMS name the driver reports (see
+    conrad.dialect.detect()), unless one is passed as dialect.
     """
 
-    def connect(self, dsn, **kwargs):
+    def connect(self, dsn, pool_size=None, pool_min=1, pool_idle_timeout=300,
+                pool_timeout=None, pool_ping=None, autocommit=False,
+                dialect=None, **kwargs):
         logger.info('Connecting to ODBC connection at {}'.format(dsn))
         self.dsn = dsn
-        self.connection = pyodbc.connect(dsn, **kwargs)
+        self.autocommit = autocommit
+        kwargs['autocommit'] = autocommit
+        self.connection_factory = lambda: pyodbc.connect(dsn, **kwargs)
+        if pool_size:
+            self.pool = ConnectionPool(self.connection_factory,
+                    min_size=pool_min, max_size=pool_size,
+                    idle_timeout=pool_idle_timeout, timeout=pool_timeout,
+                    ping=pool_ping, on_close=self.close_cursors)
+        else:
+            self.connection = self.connection_factory()
+        if dialect is None:
+            with self.checkout() as connection:
+                dialect = self.detect_dialect(connection)
+        self.dialect = dialect
 
+    @staticmethod
+    def detect_dialect(connection):
+        try:
+            name = connection.getinfo(pyodbc.SQL_DBMS_NAME)
+        except pyodbc.Error, e:
+            logger.info('Could not get the DBMS name: {}'.format(e))
+            name = None
+        logger.info('Connected to DBMS {}'.format(name))
+        return detect(name)
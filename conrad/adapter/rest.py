@@ -1,17 +1,68 @@
 import json
 import logging
+import re
+import urlparse
+
 import restkit
+from restkit.conn import Connection
+from socketpool import ConnectionPool
 
 from base import Base
+from conrad.executor import Executor
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
 
 logger = logging.getLogger(__name__)
 
 
+class BodyReader(object):
+    """
+    Wraps a restkit body stream for ijson. ijson probes its input with
+    read(0), which restkit takes as the end of the body, releasing the
+    connection; this answers that probe without touching the stream.
+    """
+
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, n=-1):
+        if n == 0:
+            return ''
+        return self.body.read(n)
+
+
 class Rest(Base):
+    """
+    An adapter for JSON REST APIs. Requests go through a pool of up to
+    pool_size keep-alive HTTP connections, so consecutive requests don't
+    pay for a new TCP (and TLS) handshake each. find_many() fetches many
+    records at once, using up to max_workers concurrent requests.
+
+    Large collections can be walked page by page with iterate(). A page
+    is either a JSON list of records, or an object holding the records
+    under items_key, and optionally the URL of the next page under
+    next_key. A next link in the Link header is followed as well.
+
+    To revalidate repeated reads instead of downloading them again, give
+    the adapter a conrad.cache.ResponseCache as its response_cache.
+    """
+
+    response_cache = None
 
-    def connect(self, uri):
+    items_key = 'items'
+    next_key = 'next'
+    page_size_param = 'per_page'
+
+    def connect(self, uri, pool_size=10, max_workers=8):
         self.uri = uri
-        self.resource = restkit.Resource(self.uri)
+        self.pool = ConnectionPool(factory=Connection, max_size=pool_size,
+                                   backend='thread')
+        self.resource = restkit.Resource(self.uri, pool=self.pool)
+        self.executor = Executor(max_workers, name='conrad-rest')
 
     def list(self, resource):
         return self.find(resource)
@@ -20,17 +71,132 @@ class Rest(Base):
         logger.debug('Finding resource {} with conditions {}'.format(
                 resource, conditions))
         if 'id' in conditions:
-            res = self.resource.get('{}/{}'.format(resource, conditions['id']))
+            body = self._read(resource, conditions['id'])
         else:
-            res = self.resource.get(resource, params_dict=conditions)
-        logger.debug('Find will convert {} to a result dict'.format(res))
-        return [self.result_dict(res.body_string())]
+            body = self._read(resource, params=conditions)
+        return [self.result_dict(body)]
+
+    def _read(self, resource, id=None, params=None):
+        # GETs id of resource (or the collection, if id is None), and
+        # returns the response body, going through the response cache if
+        # there is one.
+        path = resource if id is None else '{}/{}'.format(resource, id)
+        cache = self.response_cache
+        if cache is None:
+            return self.resource.get(path, params_dict=params).body_string()
+        headers = cache.headers(path, params)
+        res = self.resource.get(path, headers=headers, params_dict=params)
+        body = cache.response(resource, self._cache_id(id), path, params,
+                              res.status_int, res.headers, res.body_string())
+        if body is None:
+            # The cached body was evicted before the 304 arrived.
+            res = self.resource.get(path, params_dict=params)
+            body = cache.response(resource, self._cache_id(id), path, params,
+                                  res.status_int, res.headers,
+                                  res.body_string())
+        return body
+
+    @staticmethod
+    def _cache_id(id):
+        return None if id is None else str(id)
+
+    def _invalidate(self, resource, id):
+        if self.response_cache is not None:
+            self.response_cache.invalidate(resource, self._cache_id(id))
+
+    def iterate(self, resource, conditions={}, page_size=None):
+        """
+        A generator yielding the records of a paginated collection one at a
+        time, fetching the next page only when the current one is used up.
+        If the ijson module is installed, each page is parsed as it is
+        downloaded, so memory use is bounded by the size of a record rather
+        than a page, and the first record is available before the rest of
+        the page has arrived.
+        """
+        params = dict(conditions)
+        if page_size:
+            params[self.page_size_param] = page_size
+        res = self.resource.get(resource, params_dict=params)
+        while res is not None:
+            page = {}
+            for record in self._page_records(res, page):
+                yield record
+            link = self._next_link(res) or page.get('next')
+            if not link:
+                return
+            url = urlparse.urljoin(self.uri + '/', link)
+            res = restkit.Resource(url, pool=self.pool).get()
+
+    def _page_records(self, res, page):
+        # Yields the records in a page response, and sets page['next'] to
+        # the next page link found in the body, if any.
+        if ijson is None:
+            data = self.result_dict(res.body_string())
+            if isinstance(data, list):
+                records = data
+            else:
+                records = data.get(self.items_key, [])
+                page['next'] = data.get(self.next_key)
+            for record in records:
+                yield record
+            return
+        builder = item_prefix = None
+        for prefix, event, value in ijson.parse(BodyReader(res.body_stream())):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == item_prefix and event in ('end_map', 'end_array'):
+                    yield builder.value
+                    builder = None
+            elif prefix == '' and event == 'start_array':
+                item_prefix = 'item'
+            elif prefix == '' and event == 'start_map':
+                item_prefix = '{}.item'.format(self.items_key)
+            elif prefix == item_prefix:
+                if event in ('start_map', 'start_array'):
+                    builder = ObjectBuilder()
+                    builder.event(event, value)
+                else:
+                    yield value
+            elif prefix == self.next_key and event == 'string':
+                page['next'] = value
+
+    @staticmethod
+    def _next_link(res):
+        link = res.headers.get('Link')
+        if link:
+            match = re.search(r'<([^>]*)>\s*;\s*rel="?next"?', link)
+            if match:
+                return match.group(1)
+        return None
+
+    def find_many(self, resource, ids):
+        """
+        Fetches each of the given ids with GET {resource}/{id}, running the
+        requests concurrently, and returns a dict of id:record. Ids which
+        don't exist are left out.
+        """
+        futures = [(id, self.executor.submit(self._get, resource, id))
+                   for id in ids]
+        results = {}
+        for id, future in futures:
+            record = future.result()
+            if record is not None:
+                results[id] = record
+        return results
+
+    def _get(self, resource, id):
+        try:
+            body = self._read(resource, id)
+        except restkit.ResourceNotFound:
+            return None
+        return self.result_dict(body)
 
     def delete(self, resource, conditions={}):
         if 'id' in conditions:
             res = self.resource.delete('{}/{}'.format(resource, conditions['id']))
         else:
             res = self.resource.delete(resource, params_dict=conditions)
+        self._invalidate(resource, conditions.get('id'))
         return self.result_dict(res.body_string())
 
     def update(self, resource, attributes={}, conditions={}):
@@ -38,12 +204,16 @@ class Rest(Base):
             res = self.resource.put('{}/{}'.format(resource, conditions['id']), payload=attributes)
         else:
             res = self.resource.put(resource, params_dict=conditions, payload=attributes)
+        self._invalidate(resource, conditions.get('id'))
         return self.result_dict(res.body_string())
 
     def create(self, resource, attributes):
         logger.debug('Creating {} with attributes {}'.format(resource, attributes))
         res = self.resource.post(resource, payload=attributes)
         d = [self.result_dict(res.body_string())]
+        # Only the collection can have changed, along with the new record
+        # in case it was read (and missed) before.
+        self._invalidate(resource, d[0].get('id') if isinstance(d[0], dict) else None)
         logger.debug('Rest.create() is returning: {}'.format(d))
         return d
 
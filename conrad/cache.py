@@ -0,0 +1,250 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache(object):
+    """
+    A least-recently-used cache of query results, shared by every query
+    run through an adapter. Turn it on by giving the adapter one:
+
+        db.adapter.result_cache = ResultCache(max_entries=500,
+                                              table_ttls={'country': 3600})
+
+    Results are keyed on the SQL statement and its variables, and filed
+    under the table they were read from. Whenever a write to a table
+    through the adapter commits, every cached result for that table is
+    dropped, so the cache never serves data conrad itself has changed.
+
+    At most max_entries results, holding at most max_rows rows in total,
+    are kept; the least recently used ones are evicted first. Results with
+    more than max_rows rows are never cached. Entries expire after ttl
+    seconds, unless table_ttls has a different ttl for their table. A ttl
+    of None means entries only leave the cache through eviction or
+    invalidation.
+    """
+
+    def __init__(self, max_entries=1000, max_rows=100000, ttl=None,
+                 table_ttls=None):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.table_ttls = table_ttls or {}
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tables = {}
+        self._rows = 0
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, see set().
+        self.version = 0
+
+    @staticmethod
+    def key(statement, variables):
+        try:
+            key = (statement, tuple(variables))
+            hash(key)
+            return key
+        except TypeError:
+            return None
+
+    @staticmethod
+    def table_key(table):
+        # The plain table name, rather than the quoted str(table).
+        return getattr(table, 'table', table)
+
+    def get(self, table, statement, variables):
+        """
+        Returns the cached rows for statement and variables, or None.
+        """
+        key = self.key(statement, variables)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                rows, table_key, expires = entry
+                if expires is None or expires > time.time():
+                    del self._entries[key]
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return rows
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, table, statement, variables, rows, version=None):
+        """
+        Caches rows as the result of statement and variables, which were
+        read from table. If version is given, the rows are only cached if
+        the cache's version hasn't changed since, i.e. if nothing was
+        invalidated while they were being read.
+        """
+        key = self.key(statement, variables)
+        if key is None or len(rows) > self.max_rows:
+            return
+        table_key = self.table_key(table)
+        ttl = self.table_ttls.get(table_key, self.ttl)
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, table_key, expires)
+            self._tables.setdefault(table_key, set()).add(key)
+            self._rows += len(rows)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._rows > self.max_rows):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, table=None):
+        """
+        Drops every cached result read from table, or everything if table
+        is None.
+        """
+        with self._lock:
+            self.version += 1
+            if table is None:
+                self._entries.clear()
+                self._tables.clear()
+                self._rows = 0
+            else:
+                for key in list(self._tables.get(self.table_key(table), ())):
+                    self._remove(key)
+
+    def _remove(self, key):
+        # Called with the lock held.
+        rows, table_key, expires = self._entries.pop(key)
+        self._rows -= len(rows)
+        keys = self._tables.get(table_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tables[table_key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache(object):
+    """
+    A least-recently-used cache of HTTP responses for the Rest adapter,
+    which turns repeated reads into conditional requests. Turn it on by
+    giving the adapter one:
+
+        api.response_cache = ResponseCache(max_entries=500)
+
+    Responses carrying an ETag or Last-Modified header are cached with
+    their body. The next read of the same URL sends If-None-Match and
+    If-Modified-Since; if the server answers 304 Not Modified, the cached
+    body is used instead of downloading it again. Every create, update or
+    delete through the adapter drops the cached responses it affects.
+
+    At most max_entries responses, holding at most max_bytes of body in
+    total, are kept; the least recently used ones are evicted first.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=10 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._resources = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path, params):
+        return (path, tuple(sorted((params or {}).items())))
+
+    def headers(self, path, params):
+        """
+        Returns the conditional request headers for a GET of path with
+        params, which are empty if nothing is cached for it.
+        """
+        with self._lock:
+            entry = self._entries.get(self.key(path, params))
+        if entry is None:
+            return {}
+        body, etag, last_modified, tag = entry
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def response(self, resource, id, path, params, status, headers, body):
+        """
+        Handles the response to a GET of path with params, which reads id
+        (or the whole collection, if id is None) of resource. Returns the
+        cached body for a 304, and caches and returns body otherwise.
+
+        Returns None for a 304 if the entry was evicted since headers()
+        was called; the GET must then be repeated without the conditional
+        headers.
+        """
+        key = self.key(path, params)
+        with self._lock:
+            if status == 304:
+                entry = self._entries.get(key)
+                if entry is None:
+                    return None
+                del self._entries[key]
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            if key in self._entries:
+                self._remove(key)
+            etag = headers.get('ETag')
+            last_modified = headers.get('Last-Modified')
+            if (etag is None and last_modified is None) or \
+                    len(body) > self.max_bytes:
+                return body
+            tag = (resource, id)
+            self._entries[key] = (body, etag, last_modified, tag)
+            self._resources.setdefault(tag, set()).add(key)
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+        return body
+
+    def invalidate(self, resource=None, id=None):
+        """
+        Drops the cached responses for id of resource, along with those
+        for the whole collection. If id is None, drops every response for
+        resource, and if resource is None, drops everything.
+        """
+        with self._lock:
+            if resource is None:
+                self._entries.clear()
+                self._resources.clear()
+                self._bytes = 0
+                return
+            if id is None:
+                tags = [tag for tag in self._resources if tag[0] == resource]
+            else:
+                tags = [(resource, id), (resource, None)]
+            for tag in tags:
+                for key in list(self._resources.get(tag, ())):
+                    self._remove(key)
+
+    def _remove(self, key):
+        # Called with the lock held.
+        body, etag, last_modified, tag = self._entries.pop(key)
+        self._bytes -= len(body)
+        keys = self._resources.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._resources[tag]
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,18 +1,29 @@
+import json
 import logging
+import os
+import time
 from UserDict import DictMixin
 
-from adapter import default
+import session
+from adapter import ODBC
 from table import Table
 
 logger = logging.getLogger(__name__)
 
 
+# Bump this whenever the layout of the snapshot file changes.
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
 class Database(DictMixin):
     """A Database represents one connection to a database, with all of its
     tables. A Database instance can be treated as a dictionary of tables.
-    By default, the __init__ method uses conrad.adapter.default as its
-    adapter, which is a generic ODBC connection. You can pass in another
-    adapter to connect to another database type.
+    By default, the __init__ method uses a generic ODBC adapter. You can
+    pass in another adapter to connect to another database type.
 
     An example:
 
@@ -22,35 +33,151 @@ class Database(DictMixin):
         {'album': album, 'artist': artist}
         >>> print db['album'].all()
         [{'artist_id':1, 'id':1, ...}]
+
+    Tables are discovered lazily: db['artist'] only asks the catalog about
+    the artist table. The full table listing is only loaded when it is
+    needed, e.g. by db.tables or db.keys().
+
+    To skip the catalog altogether on startup, pass snapshot='some/file'.
+    If the file exists and was written for the same DSN and snapshot
+    version, the tables, columns, primary and foreign keys are loaded from
+    it. Otherwise the database is scanned, and the file is (re)written. Call
+    refresh_snapshot() after changing the schema.
     """
 
-    def __init__(self, dsn='', adapter=default, **kwargs):
+    def __init__(self, dsn='', adapter=None, snapshot=None, **kwargs):
+        if adapter is None:
+            adapter = ODBC()
         logger.debug('Using adapter {} for database.'.format(adapter))
-        self.adapter = default
+        self.adapter = adapter
         self.dsn = dsn
+        self.snapshot = snapshot
+        self._tables = {}
+        self._scanned = False
         if not self.adapter.connected:
             logger.debug('Database is calling connect for {} ({})'.format(dsn, kwargs))
             self.adapter.connect(dsn, **kwargs)
-        self.rescan()
+        if snapshot:
+            try:
+                self.load_snapshot(snapshot)
+            except SnapshotError, e:
+                logger.info('Rebuilding schema snapshot: {}'.format(e))
+                self.refresh_snapshot()
 
     def __repr__(self):
         return 'Database(dsn={})'.format(repr(self.dsn))
 
     def __getitem__(self, key):
-        return self.tables[key]
+        if key not in self._tables:
+            info = self.adapter.table_info(key)
+            if info is None:
+                raise KeyError(key)
+            self._tables[key] = self._table(info)
+        return self._tables[key]
 
     def keys(self):
         return self.tables.keys()
 
+    @property
+    def tables(self):
+        """
+        A dict of every table in the database. This loads the full table
+        listing the first time it is used.
+        """
+        if not self._scanned:
+            for name, info in self.adapter.tables.items():
+                if name not in self._tables:
+                    self._tables[name] = self._table(info)
+            self._scanned = True
+        return self._tables
+
+    def _table(self, info):
+        return Table(self, info['name'], info['catalog'], info['schema'])
+
     def rescan(self):
         """
-        Rescans and repopulates the table hash.
+        Drops all cached metadata, and repopulates the table hash.
         """
-        self.tables = {}
-        for name, info in self.adapter.tables.items():
-            self.tables[name] = Table(self, info['name'], info['catalog'],
-                                                info['schema'])
+        self.adapter.invalidate()
+        self._tables = {}
+        self._scanned = False
+        return self.tables
 
-    def close(self):
-        return
+    def transaction(self):
+        """
+        Returns a context manager which runs everything inside of its
+        with block in one transaction, see DBAPI2.transaction():
+
+            with db.transaction():
+                artist = db['artist'].create(name='Fugazi')
+                db['album'].create(title='Repeater', artist_id=artist.pk)
+        """
+        return self.adapter.transaction()
 
+    def session(self):
+        """
+        Returns a context manager which opens a session with its own
+        identity map, see conrad.session.session():
+
+            with db.session():
+                db['artist'].get(1) is db['artist'].get(1)
+        """
+        return session.session()
+
+    def save_snapshot(self, path=None):
+        """
+        Writes the table listing, along with the columns, primary keys and
+        foreign keys of every table, to path (defaults to self.snapshot).
+        """
+        path = path or self.snapshot
+        for table in self.tables.values():
+            try:
+                table.describe()
+                table.pk_field
+                table.fks
+                table.references
+            except Exception, e:
+                logger.info('Could not snapshot table {}: {}'.format(table, e))
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'dsn': self.dsn,
+            'created': time.time(),
+            'metadata': self.adapter.metadata.dump(),
+        }
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.rename(tmp, path)
+
+    def load_snapshot(self, path=None):
+        """
+        Loads a snapshot written by save_snapshot() into the adapter's
+        metadata cache. Raises SnapshotError if the file is missing,
+        unreadable, or was written by another version or for another DSN.
+        """
+        path = path or self.snapshot
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (IOError, ValueError), e:
+            raise SnapshotError('Could not read snapshot {}: {}'.format(path, e))
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            raise SnapshotError('Snapshot {} has version {}, expected {}'.format(
+                    path, snapshot.get('version'), SNAPSHOT_VERSION))
+        if snapshot.get('dsn') != self.dsn:
+            raise SnapshotError('Snapshot {} was taken for another DSN'.format(path))
+        self.adapter.metadata.load(snapshot['metadata'])
+        self._tables = {}
+        self._scanned = False
+
+    def refresh_snapshot(self, path=None):
+        """
+        Rescans the database, and rewrites the snapshot.
+        """
+        self.rescan()
+        self.save_snapshot(path)
+
+    def close(self):
+        shutdown = getattr(self.adapter, 'shutdown', None)
+        if shutdown is not None:
+            shutdown()
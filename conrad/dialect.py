@@ -0,0 +1,198 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Dialect(object):
+    """
+    The SQL spoken by one kind of database: its placeholder, identifier
+    quoting, row limiting, generated key retrieval and savepoints. Every
+    DBAPI2 adapter has a dialect, and queries compile their SQL through
+    the dialect of their table's adapter, so a limit() always runs on the
+    server, however the database spells it.
+
+    The ODBC adapter picks a dialect from the DBMS name the driver
+    reports, see detect(). To talk to another database, subclass Dialect,
+    and pass an instance to the adapter:
+
+        db = conrad.Database('MyDSN', dialect=MyDialect())
+
+    This generic dialect, used for unknown databases, speaks standard
+    SQL: it limits rows with OFFSET ... FETCH FIRST (SQL:2008), and has no
+    way to read back a generated key.
+    """
+
+    name = 'generic'
+    # Only positional styles which repeat one marker (qmark '?', or
+    # format '%s') are supported.
+    placeholder = '?'
+    # The (opening, closing) characters used to quote identifiers, or None
+    # to leave them alone.
+    quote = None
+    # How a generated key is read back after an INSERT, see
+    # DBAPI2.insert().
+    insert_key_style = 'query'
+    last_inserted_statement = None
+    # How an UPDATE returns the changed rows, see Update.returning().
+    returning_style = None
+    supports_savepoints = True
+    savepoint_statement = 'SAVEPOINT {}'
+    release_savepoint_statement = 'RELEASE SAVEPOINT {}'
+    rollback_savepoint_statement = 'ROLLBACK TO SAVEPOINT {}'
+
+    def __repr__(self):
+        return '{}()'.format(type(self).__name__)
+
+    def escape(self, name):
+        """
+        Quotes each part of a (possibly schema qualified) identifier. Parts
+        which are already quoted are left alone.
+        """
+        if not self.quote:
+            return name
+        left, right = self.quote
+        return '.'.join(
+                part if part.startswith(left) else
+                left + part.replace(right, right + right) + right
+                for part in name.split('.'))
+
+    def select(self, template, parts, offset=0, count=None):
+        """
+        Formats a SELECT template, with {select}, {table}, {conditions},
+        {order} and {limit} fields, from the parts dict, limited to count
+        rows after skipping offset rows (if count is not None).
+        """
+        limit = '' if count is None else self.limit_clause(offset, count)
+        return template.format(limit=limit, **parts).strip()
+
+    def limit_clause(self, offset, count):
+        if offset:
+            return 'OFFSET {} ROWS FETCH FIRST {} ROWS ONLY'.format(offset, count)
+        return 'FETCH FIRST {} ROWS ONLY'.format(count)
+
+
+class SQLite(Dialect):
+    name = 'sqlite'
+    quote = ('"', '"')
+    last_inserted_statement = 'SELECT last_insert_rowid() AS last_insert_rowid'
+
+    def limit_clause(self, offset, count):
+        if offset:
+            return 'LIMIT {} OFFSET {}'.format(count, offset)
+        return 'LIMIT {}'.format(count)
+
+
+class PostgreSQL(SQLite):
+    name = 'postgresql'
+    insert_key_style = 'returning'
+    last_inserted_statement = 'SELECT lastval()'
+    returning_style = 'returning'
+
+
+class MySQL(SQLite):
+    name = 'mysql'
+    quote = ('`', '`')
+    last_inserted_statement = 'SELECT LAST_INSERT_ID()'
+
+
+class SQLServer(Dialect):
+    """
+    Uses TOP n, or OFFSET ... FETCH NEXT (SQL Server 2012 and up) when
+    there is an offset.
+    """
+
+    name = 'sqlserver'
+    quote = ('[', ']')
+    insert_key_style = 'scope_identity'
+    last_inserted_statement = 'SELECT SCOPE_IDENTITY()'
+    returning_style = 'output'
+    savepoint_statement = 'SAVE TRANSACTION {}'
+    release_savepoint_statement = None
+    rollback_savepoint_statement = 'ROLLBACK TRANSACTION {}'
+
+    def select(self, template, parts, offset=0, count=None):
+        if count is None:
+            return Dialect.select(self, template, parts)
+        parts = dict(parts)
+        if not offset:
+            parts['select'] = 'TOP {} {}'.format(count, parts['select'])
+            return template.format(limit='', **parts).strip()
+        # OFFSET requires an ORDER BY.
+        parts['order'] = parts['order'] or 'ORDER BY (SELECT NULL)'
+        return template.format(
+                limit='OFFSET {} ROWS FETCH NEXT {} ROWS ONLY'.format(
+                        offset, count),
+                **parts).strip()
+
+
+class DB2(Dialect):
+    """
+    Uses FETCH FIRST n ROWS ONLY, with OFFSET (DB2 11.1 and up) when
+    there is an offset. Identifiers aren't quoted, since quoting makes
+    them case sensitive.
+    """
+
+    name = 'db2'
+    last_inserted_statement = 'SELECT IDENTITY_VAL_LOCAL() FROM SYSIBM.SYSDUMMY1'
+    savepoint_statement = 'SAVEPOINT {} ON ROLLBACK RETAIN CURSORS'
+
+    def limit_clause(self, offset, count):
+        if offset:
+            return 'OFFSET {} ROWS FETCH NEXT {} ROWS ONLY'.format(offset, count)
+        return 'FETCH FIRST {} ROWS ONLY'.format(count)
+
+
+class Oracle(Dialect):
+    """
+    Limits rows with ROWNUM, which works on every version. With an
+    offset, the page's ROWIDs are picked in a subquery, so the rows keep
+    their original columns. Oracle has no way to
+    read back a generated key through ODBC, so inserts don't return one.
+    Identifiers aren't quoted, since quoting makes them case sensitive.
+    """
+
+    name = 'oracle'
+    last_inserted_statement = None
+    release_savepoint_statement = None
+
+    def select(self, template, parts, offset=0, count=None):
+        sql = Dialect.select(self, template, parts)
+        if count is None:
+            return sql
+        if not offset:
+            return 'SELECT * FROM ({}) WHERE ROWNUM <= {}'.format(sql, count)
+        rowids = Dialect.select(self, template, dict(parts,
+                select='ROWID conrad_rid'))
+        page = ('SELECT conrad_rid FROM (SELECT conrad_rid, ROWNUM conrad_rn '
+                'FROM ({}) WHERE ROWNUM <= {}) WHERE conrad_rn > {}').format(
+                        rowids, offset + count, offset)
+        return Dialect.select(self, template, dict(parts,
+                conditions='WHERE ROWID IN ({})'.format(page)))
+
+
+# Substrings of the DBMS name reported by the driver, checked in order.
+DIALECTS = [
+    ('sql server', SQLServer),
+    ('sqlite', SQLite),
+    ('postgres', PostgreSQL),
+    ('mysql', MySQL),
+    ('mariadb', MySQL),
+    ('db2', DB2),
+    ('oracle', Oracle),
+]
+
+generic = Dialect()
+
+
+def detect(dbms_name):
+    """
+    Returns a new instance of the dialect for a DBMS name, as reported by
+    the driver (e.g. ODBC's SQL_DBMS_NAME), or of the generic Dialect if
+    the name isn't known.
+    """
+    name = (dbms_name or '').lower()
+    for key, dialect in DIALECTS:
+        if key in name:
+            return dialect()
+    logger.info('No dialect for DBMS {}, using the generic one'.format(dbms_name))
+    return Dialect()
@@ -0,0 +1,172 @@
+import logging
+import sys
+import threading
+from Queue import Queue
+
+logger = logging.getLogger(__name__)
+
+
+class Future(object):
+    """
+    The result of a call which runs on an Executor. result() blocks until
+    the call is done, then returns its value, or raises its exception.
+    Callbacks added with add_done_callback() are called with the Future
+    when it is done, on the worker thread. To hand the result to an event
+    loop, schedule it from the callback, e.g. with the loop's
+    call_soon_threadsafe().
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for result')
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for result')
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception, e:
+                logger.error('Error in Future callback: {}'.format(e))
+
+
+class Executor(object):
+    """
+    A fixed-size pool of worker threads, running the calls given to
+    submit() in order, and returning a Future for each:
+
+        executor = Executor(max_workers=4)
+        future = executor.submit(db['artist'].get, 1)
+        print future.result()
+
+    At most max_workers calls run at once; the rest wait in a queue, which
+    holds at most max_queue calls (0 means no limit) before submit()
+    blocks. If given, initializer() is called on each worker thread when it
+    starts, and finalizer() when it stops, e.g. to give each worker its own
+    database connection. If initializer() raises, every call that worker
+    takes fails with its exception. Workers are started on the first
+    submit().
+    """
+
+    def __init__(self, max_workers=4, max_queue=0, initializer=None,
+                 finalizer=None, name='conrad-worker'):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.finalizer = finalizer
+        self.name = name
+        self._queue = Queue(max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedules fn(*args, **kwargs) to run on a worker, and returns a
+        Future for its result.
+        """
+        if self._shutdown:
+            raise RuntimeError('Cannot submit to an Executor after shutdown')
+        self._start()
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def map(self, fn, *iterables):
+        """
+        Like map(), but every call runs on the workers. Returns the list
+        of Futures, in order.
+        """
+        return [self.submit(fn, *args) for args in zip(*iterables)]
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once the queued calls have run.
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = list(self._threads)
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name='{}-{}'.format(
+                        self.name, len(self._threads)))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        # If the initializer fails, the worker keeps taking calls off the
+        # queue, but fails each of them with the initializer's error
+        # instead of running it, so their Futures don't wait forever.
+        failed = None
+        if self.initializer is not None:
+            try:
+                self.initializer()
+            except BaseException:
+                failed = sys.exc_info()
+                logger.error('Error in Executor initializer: {}'.format(
+                        failed[1]))
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                future, fn, args, kwargs = item
+                if failed is not None:
+                    future.set_exception(failed)
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException:
+                    future.set_exception(sys.exc_info())
+                else:
+                    future.set_result(result)
+        finally:
+            if self.finalizer is not None and failed is None:
+                self.finalizer()
@@ -0,0 +1,110 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+EVENTS = ('before_execute', 'after_execute', 'on_error')
+
+
+class Execution(object):
+    """
+    Describes one statement run by an adapter, and is passed to every
+    hook:
+
+        adapter     the adapter running the statement
+        connection  the connection it runs on
+        statement   the SQL
+        parameters  its parameters (a list of parameter sequences for
+                    executemany())
+        many        True for executemany()
+        started     the timeit.default_timer() value when it started
+        duration    the wall time in seconds, once it has finished
+        rows        the number of rows fetched, once it has finished
+        rowcount    the cursor's rowcount, once it has finished
+        error       the exception, for on_error
+
+    For DBAPI2.stream(), the statement finishes once the last row has
+    been fetched, so duration includes the time spent consuming rows.
+    """
+
+    __slots__ = ('adapter', 'connection', 'statement', 'parameters', 'many',
+                 'started', 'duration', 'rows', 'rowcount', 'error')
+
+    def __init__(self, adapter, connection, statement, parameters, many=False):
+        self.adapter = adapter
+        self.connection = connection
+        self.statement = statement
+        self.parameters = parameters
+        self.many = many
+        self.started = None
+        self.duration = None
+        self.rows = 0
+        self.rowcount = None
+        self.error = None
+
+    def __repr__(self):
+        return 'Execution({!r}, duration={}, rows={})'.format(
+                self.statement, self.duration, self.rows)
+
+
+class Hooks(object):
+    """
+    The callables to run around statements. Each one is called with an
+    Execution:
+
+        before_execute  before the statement is sent
+        after_execute   after it has finished successfully
+        on_error        when it raises, before the error is handled
+
+    Every DBAPI2 adapter has its own Hooks, as adapter.hooks, and the
+    hooks in conrad.hooks.hooks run for every adapter:
+
+        def slow(execution):
+            if execution.duration > 0.5:
+                print 'Slow query:', execution.statement
+
+        db.adapter.hooks.add('after_execute', slow)
+
+    When no hooks are registered, adapters skip the timing and bookkeeping
+    altogether. Errors raised by hooks are logged and ignored.
+    """
+
+    def __init__(self):
+        self._hooks = dict((event, ()) for event in EVENTS)
+        self._lock = threading.Lock()
+        self.active = False
+
+    def add(self, event, hook):
+        """
+        Registers hook for event, and returns it.
+        """
+        if event not in self._hooks:
+            raise ValueError('Unknown hook event: {}'.format(event))
+        with self._lock:
+            self._hooks[event] = self._hooks[event] + (hook,)
+            self.active = True
+        return hook
+
+    def remove(self, event, hook):
+        with self._lock:
+            hooks = list(self._hooks[event])
+            hooks.remove(hook)
+            self._hooks[event] = tuple(hooks)
+            self.active = any(self._hooks.values())
+
+    def clear(self):
+        with self._lock:
+            self._hooks = dict((event, ()) for event in EVENTS)
+            self.active = False
+
+    def fire(self, event, execution):
+        for hook in self._hooks[event]:
+            try:
+                hook(execution)
+            except Exception, e:
+                logger.error('Error in {} hook {}: {}'.format(event, hook, e))
+
+
+# Hooks which run for every adapter.
+hooks = Hooks()
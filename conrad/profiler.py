@@ -0,0 +1,254 @@
+import json
+import random
+import re
+import sys
+import threading
+from contextlib import contextmanager
+
+from conrad import hooks
+
+# Frames in these modules are skipped when looking for the call site of
+# a statement, so the call site is the code which used conrad.
+INTERNAL_MODULES = ('conrad.adapter', 'conrad.query', 'conrad.table',
+                    'conrad.resource', 'conrad.database', 'conrad.session',
+                    'conrad.cache', 'conrad.executor', 'conrad.hooks',
+                    'conrad.profiler', 'conrad.dialect', 'contextlib')
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_in_lists = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_spaces = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """
+    Returns the shape of a statement: literals and placeholders are
+    replaced with ?, IN (...) lists of any length are collapsed, and
+    whitespace is squeezed, so that statements which differ only in their
+    parameters have the same shape.
+    """
+    shape = _literals.sub('?', statement)
+    shape = _in_lists.sub('IN (...)', shape)
+    return _spaces.sub(' ', shape).strip()
+
+
+def call_site():
+    """
+    Returns (filename, line, function) of the innermost frame outside of
+    conrad, or None.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(INTERNAL_MODULES):
+            code = frame.f_code
+            return (code.co_filename, frame.f_lineno, code.co_name)
+        frame = frame.f_back
+    return None
+
+
+def format_site(site):
+    if site is None:
+        return '?'
+    return '{}:{} in {}'.format(*site)
+
+
+class ShapeStats(object):
+    """
+    What a Profile knows about one statement shape.
+    """
+
+    def __init__(self, shape, max_samples):
+        self.shape = shape
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.rows = 0
+        self.parameters = set()
+        self.call_sites = {}
+        self._samples = []
+        self._max_samples = max_samples
+
+    def add(self, execution, site, max_parameters):
+        self.count += 1
+        duration = execution.duration or 0.0
+        self.total += duration
+        self.rows += execution.rows
+        if execution.error is not None:
+            self.errors += 1
+        # Reservoir sampling keeps the percentiles honest without keeping
+        # every duration.
+        if len(self._samples) < self._max_samples:
+            self._samples.append(duration)
+        else:
+            i = random.randint(0, self.count - 1)
+            if i < self._max_samples:
+                self._samples[i] = duration
+        if len(self.parameters) < max_parameters:
+            try:
+                self.parameters.add(tuple(execution.parameters))
+            except TypeError:
+                pass
+        count, total = self.call_sites.get(site, (0, 0.0))
+        self.call_sites[site] = (count + 1, total + duration)
+
+    def percentile(self, p):
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))]
+
+    def as_dict(self):
+        return {
+            'shape': self.shape,
+            'count': self.count,
+            'errors': self.errors,
+            'total': self.total,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'rows': self.rows,
+            'call_sites': [{'site': format_site(site), 'count': count,
+                            'total': total}
+                           for site, (count, total) in sorted(
+                                   self.call_sites.items(),
+                                   key=lambda item: -item[1][1])],
+        }
+
+
+class Profile(object):
+    """
+    Aggregates the statements run while it is installed (see profile())
+    by shape: how often each shape ran, its total, median and 99th
+    percentile wall time, the rows it fetched, and the call sites it was
+    run from.
+
+    A SELECT shape which ran at least n_plus_one times, with at least as
+    many different parameters, is reported as a likely N+1 query: rows
+    loaded one at a time, e.g. by Table.get() or Resource.related() in a
+    loop, instead of with Table.get_many() or Select.prefetch().
+    """
+
+    def __init__(self, n_plus_one=10, max_samples=1000, thread=None):
+        self.n_plus_one = n_plus_one
+        self.max_samples = max_samples
+        self.thread = thread
+        self.shapes = {}
+        self._lock = threading.Lock()
+
+    def record(self, execution):
+        """
+        Adds an Execution to the profile. This is the hook installed by
+        profile().
+        """
+        if self.thread is not None and threading.current_thread() is not self.thread:
+            return
+        site = call_site()
+        shape = normalize(execution.statement)
+        with self._lock:
+            stats = self.shapes.get(shape)
+            if stats is None:
+                stats = self.shapes[shape] = ShapeStats(shape, self.max_samples)
+            stats.add(execution, site, self.n_plus_one)
+
+    @property
+    def count(self):
+        return sum(s.count for s in self.shapes.values())
+
+    @property
+    def total(self):
+        return sum(s.total for s in self.shapes.values())
+
+    def top(self):
+        """
+        Returns the ShapeStats, the most expensive first.
+        """
+        return sorted(self.shapes.values(), key=lambda s: -s.total)
+
+    def n_plus_one_suspects(self):
+        return [s for s in self.top()
+                if s.shape.upper().startswith('SELECT')
+                and s.count >= self.n_plus_one
+                and len(s.parameters) >= self.n_plus_one]
+
+    def call_sites(self):
+        """
+        Returns a list of (site, count, total) for every call site, the
+        most expensive first.
+        """
+        sites = {}
+        for stats in self.shapes.values():
+            for site, (count, total) in stats.call_sites.items():
+                c, t = sites.get(site, (0, 0.0))
+                sites[site] = (c + count, t + total)
+        return sorted(((site, c, t) for site, (c, t) in sites.items()),
+                      key=lambda item: -item[2])
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'shapes': [s.as_dict() for s in self.top()],
+            'n_plus_one': [s.shape for s in self.n_plus_one_suspects()],
+            'call_sites': [{'site': format_site(site), 'count': count,
+                            'total': total}
+                           for site, count, total in self.call_sites()],
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_text(self, limit=20):
+        """
+        Returns a plain text report of the limit most expensive shapes,
+        the N+1 suspects, and the most expensive call sites.
+        """
+        lines = ['{} statements in {:.3f}s'.format(self.count, self.total), '',
+                 '{:>7} {:>9} {:>9} {:>9} {:>8}  {}'.format(
+                         'count', 'total', 'p50', 'p99', 'rows', 'shape')]
+        for s in self.top()[:limit]:
+            lines.append('{:>7} {:>9.4f} {:>9.4f} {:>9.4f} {:>8}  {}'.format(
+                    s.count, s.total, s.percentile(50), s.percentile(99),
+                    s.rows, s.shape))
+        suspects = self.n_plus_one_suspects()
+        if suspects:
+            lines += ['', 'Possible N+1 queries (use Table.get_many() or '
+                      'Select.prefetch()):']
+            for s in suspects:
+                site = max(s.call_sites.items(), key=lambda item: item[1][0])[0]
+                lines.append('  {} x{}, from {}'.format(
+                        s.shape, s.count, format_site(site)))
+        lines += ['', 'Call sites:']
+        for site, count, total in self.call_sites()[:limit]:
+            lines.append('  {:>7} {:>9.4f}  {}'.format(
+                    count, total, format_site(site)))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.to_text()
+
+
+@contextmanager
+def profile(adapter=None, all_threads=False, **kwargs):
+    """
+    Profiles the statements run inside of the with block, and yields the
+    Profile:
+
+        with conrad.profile() as p:
+            handle_request()
+        logger.info(p.to_text())
+
+    By default, every adapter is profiled, but only statements run on the
+    current thread, so concurrent requests don't end up in each other's
+    profiles. Pass all_threads=True to include other threads (e.g. the
+    adapter's executor), and adapter to only profile that adapter. Other
+    arguments are passed on to Profile.
+    """
+    thread = None if all_threads else threading.current_thread()
+    p = Profile(thread=thread, **kwargs)
+    target = hooks.hooks if adapter is None else adapter.hooks
+    target.add('after_execute', p.record)
+    target.add('on_error', p.record)
+    try:
+        yield p
+    finally:
+        target.remove('after_execute', p.record)
+        target.remove('on_error', p.record)
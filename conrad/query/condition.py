@@ -1,4 +1,4 @@
-__all__ = ['gt', 'lt', 'gte', 'lte', 'Condition']
+__all__ = ['gt', 'lt', 'gte', 'lte', 'in_', 'Condition']
 
 
 class Condition(object):
@@ -47,6 +47,12 @@ class Condition(object):
     def __init__(self, variable):
         self.variable = variable
 
+    @property
+    def variables(self):
+        # The values for the placeholders in the statement, in order.
+        # Override this along with the statement if there isn't just one.
+        return [self.variable]
+
     @property
     def statement(self):
         # Override this property for more extreme conditions
@@ -73,7 +79,46 @@ class LessThanOrEqualTo(Condition):
     operator = '<='
 
 
+class In(Condition):
+    """
+    Matches any of a sequence of values:
+
+        Select('person').filter(id=in_([1, 2, 3]))
+
+    generates "WHERE id IN (?, ?, ?)". An empty sequence matches nothing.
+    Repeated values are only sent once.
+    """
+
+    def __init__(self, variable):
+        seen = set()
+        self.variable = []
+        for value in variable:
+            try:
+                if value in seen:
+                    continue
+                seen.add(value)
+            except TypeError:
+                # Unhashable values are compared with the ones kept so far.
+                if value in self.variable:
+                    continue
+            self.variable.append(value)
+
+    @property
+    def statement(self):
+        if not self.variable:
+            # This still names the column, so that it doesn't collide with
+            # an empty in_() on another column in FilterableQuery.conditions.
+            return '{name} IS NULL AND 1 = 0'
+        return '{{name}} IN ({})'.format(
+                ', '.join(['{placeholder}'] * len(self.variable)))
+
+    @property
+    def variables(self):
+        return self.variable
+
+
 gt = GreaterThan
 lt = LessThan
 gte = GreaterThanOrEqualTo
 lte = LessThanOrEqualTo
+in_ = In
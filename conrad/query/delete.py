@@ -6,8 +6,7 @@ class Delete(FilterableQuery):
 
     template = 'DELETE FROM {table} {conditions}'
 
-    @property
-    def statement(self):
+    def compile(self):
         return self.template.format(
             table = self.table,
             conditions = self.where_clause
@@ -15,4 +14,4 @@ class Delete(FilterableQuery):
 
     @property
     def variables(self):
-        return self.conditions.values()
\ No newline at end of file
+        return self.condition_variables
\ No newline at end of file
@@ -4,11 +4,40 @@ from query import Query
 class Insert(Query):
     """Implements an INSERT query."""
 
-    template = 'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+    template = 'INSERT INTO {table} ({columns}){output} VALUES {values}{returning}'
+    # The key styles which return the inserted rows, so that one statement
+    # can insert many rows and still return all of their keys.
+    multi_row_styles = ('returning', 'output')
 
     def __init__(self, table=None, **kwargs):
         Query.__init__(self, table)
         self.updates = kwargs
+        self.rows = None
+        # How the generated key is read back, see DBAPI2.insert().
+        # execute() sets this from the adapter.
+        self.key_style = None
+        # After execute(), the inserted row, if the key_style returned it.
+        self.row = None
+        # After a bulk execute(returning=True), the inserted rows, if the
+        # key_style returned them.
+        self.returned_rows = None
+        # The number of VALUES (...) tuples in the statement.
+        self.values_rows = 1
+
+    def many(self, rows):
+        """Switch this query to bulk mode: insert one row for each dict in
+        rows, in one executemany() call. Every row must set the same
+        columns. This is chainable."""
+        rows = list(rows)
+        if not rows:
+            raise ValueError('many() requires at least one row')
+        columns = set(rows[0].keys())
+        for row in rows:
+            if set(row.keys()) != columns:
+                raise ValueError('All rows must set the same columns')
+        self.updates = dict(rows[0])
+        self.rows = rows
+        return self
 
     def set(self, **kwargs):
         """Set a column to a specified value, as supplied by the
@@ -17,13 +46,76 @@ class Insert(Query):
         return self
 
     @property
-    def statement(self):
+    def shape(self):
+        return Query.shape.fget(self) + (tuple(self.updates.keys()),
+                                         self.key_style, self.values_rows)
+
+    def compile(self):
+        style = self.key_style
+        if style == 'returning':
+            returning = ' RETURNING *'
+        elif style == 'scope_identity':
+            returning = '; SELECT SCOPE_IDENTITY()'
+        else:
+            returning = ''
         return self.template.format(
             table = self.table,
             columns = ', '.join(self.updates.keys()),
-            placeholders = ', '.join([self.placeholder for v in self.updates])
+            output = ' OUTPUT INSERTED.*' if style == 'output' else '',
+            values = ', '.join(['({})'.format(', '.join(
+                    [self.placeholder for v in self.updates]))] * self.values_rows),
+            returning = returning,
         ).strip()
 
     @property
     def variables(self):
+        if self.rows is not None:
+            columns = self.updates.keys()
+            return [tuple(row[c] for c in columns) for row in self.rows]
         return self.updates.values()
+
+    def execute(self, returning=False):
+        """Inserts the row, and returns its generated key, read back in the
+        same round trip where the insert_key_style of the adapter's dialect
+        allows it (see DBAPI2.insert()). If that style returns the whole row, it is kept
+        in self.row.
+
+        In bulk mode, runs the statement with the adapter's
+        executemany(), returning the number of inserted rows, or the list of
+        generated keys if returning is True. If the key_style returns rows,
+        the keys are read with multi-row INSERT ... VALUES (...), (...)
+        statements instead, in one transaction, and the inserted rows are
+        kept in self.returned_rows; the keys are then in the order the
+        database returned the rows."""
+        adapter = self.table.database.adapter
+        pk = self.table.pk_field
+        if self.rows is None:
+            self.key_style = adapter.dialect.insert_key_style
+            key, self.row = adapter.insert(self.statement, self.variables, pk)
+        elif returning and adapter.dialect.insert_key_style in self.multi_row_styles:
+            key = self._insert_returning(adapter, pk)
+        else:
+            self.key_style = adapter.dialect.insert_key_style if returning else None
+            key = adapter.executemany(self.statement, self.variables,
+                                      returning=returning, pk=pk)
+        return key
+
+    def _insert_returning(self, adapter, pk):
+        # Inserts self.rows with as many rows per statement as the
+        # adapter's max_parameters allows, and returns their keys.
+        self.key_style = adapter.dialect.insert_key_style
+        variables = self.variables
+        size = max(1, adapter.max_parameters // len(self.updates))
+        self.returned_rows = []
+        try:
+            with adapter.transaction():
+                for start in range(0, len(variables), size):
+                    chunk = variables[start:start + size]
+                    self.values_rows = len(chunk)
+                    self.returned_rows += adapter.execute(
+                            self.statement, *[v for row in chunk for v in row])
+        finally:
+            self.values_rows = 1
+        names = [d[0] for d in self.returned_rows[0].cursor_description]
+        index = names.index(pk) if pk in names else 0
+        return [row[index] for row in self.returned_rows]
@@ -1,24 +1,43 @@
 import logging
-from abc import ABCMeta, abstractproperty
+from abc import ABCMeta, abstractmethod, abstractproperty
 
+from conrad import dialect, session
 from conrad.query import Condition
+from conrad.query.condition import In
 
 logger = logging.getLogger(__name__)
 
 
+# Compiled SQL text, keyed on Query.shape. See Query.statement.
+STATEMENT_CACHE_SIZE = 1024
+_statements = {}
+
+
 class Query(object):
     """Handles generation of various SQL queries, and acts as a repository
     for the results. This class is abstract, and should be subclassed."""
 
     __metaclass__ = ABCMeta
-    placeholder = '?'
+    # True for queries which only read, and so may be answered from the
+    # adapter's result cache. Queries which write invalidate it instead.
+    read_only = False
+    # False for queries which don't select every column, whose rows must
+    # stay out of the identity map.
+    whole_rows = True
 
     def __init__(self, table):
         logging.debug('Initializing query for table {}'.format(table))
         self.updates = {}
-        self.limit_clause = ''
+        # (offset, count) set by limit(), or None.
+        self.limit_range = None
         self.order_by_clause = ''
         self.table = table
+        self.batch_size = None
+        self.use_identity_map = True
+        # Set to False to always read from the database, even if the
+        # adapter has a result_cache.
+        self.use_cache = True
+        self._dialect = None
         self._cache = None
 
     def __repr__(self):
@@ -26,11 +45,59 @@ class Query(object):
         return repr(self.cache)
 
     def __len__(self):
-        """Returns the length of the cache."""
+        """Returns the length of the cache. This fetches the results if
+        they weren't already, and iterating reuses them."""
         return len(self.cache)
 
-    @abstractproperty
+    @property
+    def dialect(self):
+        """The Dialect of the table's adapter, which the SQL is compiled
+        for. Tables outside of a database get the generic dialect, unless
+        one is set, e.g. by an adapter building a query on a table name."""
+        if self._dialect is not None:
+            return self._dialect
+        try:
+            return self.table.database.adapter.dialect
+        except AttributeError:
+            return dialect.generic
+
+    @dialect.setter
+    def dialect(self, dialect):
+        self._dialect = dialect
+
+    @property
+    def placeholder(self):
+        return self.dialect.placeholder
+
+    @property
     def statement(self):
+        """The SQL statement for this query. Queries with the same shape
+        always produce the same SQL, so it is only compiled once per shape,
+        and looked up afterwards."""
+        return self.compiled(self.shape, self.compile)
+
+    @staticmethod
+    def compiled(shape, compile):
+        """Returns the SQL cached for shape, calling compile() to build it
+        the first time."""
+        try:
+            return _statements[shape]
+        except KeyError:
+            if len(_statements) >= STATEMENT_CACHE_SIZE:
+                _statements.clear()
+            sql = _statements[shape] = compile()
+            return sql
+
+    @property
+    def shape(self):
+        """A hashable description of everything the SQL statement depends
+        on, but not the variables. Extend this in subclasses, along with
+        compile()."""
+        return (type(self), self.dialect, str(self.table),
+                self.order_by_clause, self.limit_range)
+
+    @abstractmethod
+    def compile(self):
         """Override this with the code that will generate the SQL statement."""
         return
 
@@ -49,6 +116,13 @@ class Query(object):
     def all(self):
         return self
 
+    def batch(self, size):
+        """Sets how many rows are fetched from the database at a time
+        while iterating. Defaults to the adapter's arraysize. This is
+        chainable."""
+        self.batch_size = size
+        return self
+
     def __getitem__(self, key):
         """Gets the specified item from the cache. You can specify slices
         to get chunks of data."""
@@ -68,18 +142,93 @@ class Query(object):
 
     def __iter__(self):
         """Allows you to iterate through results, without incurring overhead
-        of putting everything in memory. Yay generators!"""
-        for row in self.execute():
-            resource = self.table(**row)
-            resource.new = False
+        of putting everything in memory. Yay generators! Rows are streamed
+        from the cursor batch_size at a time. Inside of a session, rows
+        which are already in the session's identity map are yielded as the
+        existing Resource, unless the query only selects some of the
+        columns. All of the rows share one RowLayout, built from the cursor
+        description of the first row. If the results are in the cache
+        when iteration starts, they are iterated instead (list() calls
+        len(), which fills the cache, after iter())."""
+        return self._resources()
+
+    def _resources(self):
+        if self._cache is not None:
+            for resource in self._cache:
+                yield resource
+            return
+        identity_map = None
+        if self.use_identity_map and self.whole_rows:
+            identity_map = session.current()
+        from_row = self.table.from_row
+        layout = None
+        for row in self.iter_rows():
+            if layout is None:
+                layout = self.table.layout(row.cursor_description)
+            resource = from_row(layout, row)
+            if identity_map is not None:
+                resource = identity_map.add(resource)
             yield resource
 
+    def afetch(self):
+        """Runs this query on the adapter's executor, and returns a Future
+        for the list of results. The results are also kept in the cache."""
+        return self.table.database.adapter.submit(lambda: self.cache)
+
+    def iter_rows(self):
+        """Returns an iterator over the raw rows returned by this query.
+        If the adapter has a result_cache, read-only queries are answered
+        from it, except inside of a transaction or if use_cache is
+        False."""
+        return self.rows(self.statement, self.variables)
+
+    def rows(self, statement, variables):
+        """Runs statement, a variant of this query's statement, and returns
+        an iterator over its rows, going through the result cache like
+        iter_rows()."""
+        adapter = self.table.database.adapter
+        cache = getattr(adapter, 'result_cache', None)
+        if (not (self.read_only and self.use_cache) or cache is None
+                or adapter.in_transaction):
+            return adapter.stream(statement, *variables,
+                                  arraysize=self.batch_size)
+        rows = cache.get(self.table, statement, variables)
+        if rows is None:
+            return self._caching(cache, statement, variables)
+        return iter(rows)
+
+    def _caching(self, cache, statement, variables):
+        # Streams the rows, keeping a copy to cache until there are more
+        # than the cache would keep anyway. Only a fully read result is
+        # cached, and only if no write invalidated the cache meanwhile.
+        version = cache.version
+        rows = []
+        for row in self.table.database.adapter.stream(
+                statement, *variables, arraysize=self.batch_size):
+            if rows is not None:
+                rows.append(row)
+                if len(rows) > cache.max_rows:
+                    rows = None
+            yield row
+        if rows is not None:
+            cache.set(self.table, statement, variables, rows, version)
+
     def execute(self):
         """Executes this query on self.table.database.adapter, and
-        returns the results of said query."""
+        returns the results of said query. Writes drop the cached results
+        of their table, see DBAPI2._commit()."""
         return self.table.database.adapter.execute(
                 self.statement, *self.variables)
 
+    def invalidate_cache(self):
+        """Drops the cached results for this query's table from the
+        adapter's result_cache, if it has one. The adapter does this after
+        every write, so this is only needed for changes made outside of
+        conrad."""
+        cache = getattr(self.table.database.adapter, 'result_cache', None)
+        if cache is not None:
+            cache.invalidate(self.table)
+
 
 class FilterableQuery(Query):
     """This is a query which allows you to filter your set of results. In
@@ -89,6 +238,10 @@ class FilterableQuery(Query):
     def __init__(self, *args, **kwargs):
         Query.__init__(self, *args, **kwargs)
         self.conditions = {}
+        # The SQL of each in_() condition, keyed on column name. Its
+        # placeholder count depends on the values, so a new in_() on the
+        # same column has to replace it explicitly.
+        self.in_conditions = {}
 
     def filter(self, **kwargs):
         """Supply one or more keyword arguments to use as filters. This
@@ -99,16 +252,29 @@ class FilterableQuery(Query):
                 logger.debug('Filter statement is Condition')
                 sql = value.statement.format(name=key,
                         placeholder=self.placeholder)
-                self.conditions[sql] = value.variable
+                if isinstance(value, In):
+                    self.conditions.pop(self.in_conditions.get(key), None)
+                    self.in_conditions[key] = sql
+                self.conditions[sql] = value.variables
                 logger.debug('Adding filter SQL: {}'.format(sql))
-                logger.debug('Adding filter variable: {}'.format(value.variable))
+                logger.debug('Adding filter variables: {}'.format(value.variables))
             else:
                 logger.debug('Filter is not Condition, using raw value: {}'.format(value))
                 logger.debug('Filter value is of type {}'.format(type(value)))
-                self.conditions['{} = {}'.format(key, self.placeholder)] = value
+                self.conditions['{} = {}'.format(key, self.placeholder)] = [value]
         logger.debug("After adding filter, conditions: {}".format(self.conditions))
         return self
 
+    @property
+    def shape(self):
+        return Query.shape.fget(self) + (tuple(self.conditions.keys()),)
+
+    @property
+    def condition_variables(self):
+        """The variables for the placeholders in the WHERE clause, in the
+        same order as the conditions."""
+        return [v for variables in self.conditions.values() for v in variables]
+
     @property
     def where_clause(self):
         """Returns a string representing the WHERE clause of the SQL
@@ -1,14 +1,23 @@
+import copy
+import itertools
+
+from condition import gt, in_
+from delete import Delete
 from query import FilterableQuery
+from update import Update
 
 
 class Select(FilterableQuery):
     """Implements a SELECT query."""
 
     template = 'SELECT {select} FROM {table} {conditions} {order} {limit}'
+    count_template = 'SELECT COUNT(*) FROM {table} {conditions}'
+    read_only = True
 
     def __init__(self, table=None, fields=()):
         FilterableQuery.__init__(self, table)
         self.select_fields = fields
+        self.prefetch_relations = ()
 
     def select(self, *fields):
         if '*' in fields:
@@ -17,15 +26,21 @@ class Select(FilterableQuery):
             self.select_fields = fields
         return self
 
+    @property
+    def whole_rows(self):
+        return not self.select_fields
+
     def limit(self, upper, lower=None):
         """Limit the results of the query. If only an upper bound is
-        specified, lower is assumed to be 0."""
+        specified, lower is assumed to be 0. The limit is applied by the
+        database, in the syntax of its dialect (LIMIT, TOP, FETCH FIRST or
+        ROWNUM)."""
         if upper and not lower:
-            self.limit_clause = 'LIMIT {}'.format(upper)
+            self.limit_range = (0, upper)
         elif upper and lower:
             if lower >= upper:
                 raise ValueError('lower bound must be less than upper bound')
-            self.limit_clause = 'LIMIT {} {}'.format(lower, upper-lower)
+            self.limit_range = (lower, upper-lower)
         return self
 
     def order_by(self, field, direction='ASC'):
@@ -35,16 +50,226 @@ class Select(FilterableQuery):
         self.order_by_clause = 'ORDER BY {} {}'.format(field, direction)
         return self
 
+    def prefetch(self, *relations):
+        """Eagerly loads the named relations (see Resource.related()) of
+        the results. Instead of one query per row, the related rows are
+        loaded with one IN (...) query per relation for each batch of
+        results:
+
+            for album in db['album'].all().prefetch('artist'):
+                print album['title'], album.related('artist')['name']
+
+        This is chainable."""
+        self.prefetch_relations = self.prefetch_relations + relations
+        return self
+
+    def values(self, *fields):
+        """Returns an iterator over the matching rows as plain dicts of
+        field:value, skipping Resources altogether. Only the given fields
+        are selected, or every column if there are none."""
+        rows = self._projection(fields)
+        names = None
+        for row in rows:
+            if names is None:
+                names = [d[0] for d in row.cursor_description]
+            yield dict(zip(names, row))
+
+    def values_list(self, *fields, **kwargs):
+        """Like values(), but returns an iterator over tuples of values,
+        straight from the cursor. With flat=True and a single field, the
+        values themselves are returned instead of 1-tuples:
+
+            names = list(db['artist'].all().values_list('name', flat=True))
+        """
+        flat = kwargs.pop('flat', False)
+        if kwargs:
+            raise TypeError('Unexpected arguments: {}'.format(kwargs.keys()))
+        if flat and len(fields) != 1:
+            raise ValueError('flat=True requires exactly one field')
+        rows = self._projection(fields)
+        if flat:
+            return (row[0] for row in rows)
+        return (tuple(row) for row in rows)
+
+    def _projection(self, fields):
+        query = self._clone()
+        if fields:
+            query.select(*fields)
+        return query.iter_rows()
+
+    def update(self, **values):
+        """Sets the given columns to the given values in every matching
+        row, with a single UPDATE statement, and returns the number of
+        rows changed, or None if the driver doesn't report it. Resources
+        which were already loaded aren't changed. Errors are raised.
+
+            db['album'].filter(artist_id=3).update(artist_id=4)
+        """
+        return self._write(lambda: Update(self.table, **values), len(values))
+
+    def delete(self):
+        """Deletes every matching row with a single DELETE statement, and
+        returns the number of rows deleted, or None if the driver doesn't
+        report it. Errors are raised."""
+        return self._write(lambda: Delete(self.table))
+
+    def _write(self, factory, reserved=0):
+        # Runs the write for each chunk of a split query in one
+        # transaction, so errors are raised and nothing is half written.
+        # Returns None if the driver didn't report a rowcount.
+        if self.limit_range:
+            raise ValueError('Cannot update or delete a limited query')
+        count = 0
+        with self.table.database.adapter.transaction():
+            for query in self._split(reserved) or [self]:
+                write = factory()
+                write.conditions = dict(query.conditions)
+                write.in_conditions = dict(query.in_conditions)
+                rowcount = write.execute()
+                if count is not None:
+                    count = None if rowcount < 0 else count + rowcount
+        return count
+
+    def count(self):
+        """Returns the number of matching rows. Unless the results were
+        already fetched, this runs a SELECT COUNT(*), so no rows are
+        transferred. Use this rather than len(), which fetches the rows
+        (list() calls len() too, so it can't run a separate query)."""
+        if self._cache is not None:
+            return len(self._cache)
+        return sum(q._count() for q in self._split() or [self])
+
+    def _count(self):
+        sql = self.compiled(self.shape + ('count',), self.compile_count)
+        rows = list(self.rows(sql, self.variables))
+        return rows[0][0] if rows else 0
+
+    def compile_count(self):
+        if self.limit_range:
+            return 'SELECT COUNT(*) FROM ({}) counted'.format(self.compile())
+        return self.count_template.format(
+            table = self.table,
+            conditions = self.where_clause,
+        ).strip()
+
+    def exists(self):
+        """Returns True if there is at least one matching row. Unless the
+        results were already fetched, this only asks for one row."""
+        if self._cache is not None:
+            return bool(self._cache)
+        if self.limit_range:
+            return self.count() > 0
+        for query in self._split() or [self]:
+            probe = query._clone().select('1').limit(1)
+            if list(probe.iter_rows()):
+                return True
+        return False
+
+    def __nonzero__(self):
+        return self.exists()
+
+    def iter_rows(self):
+        """Like Query.iter_rows(), but if the query has more variables than
+        the adapter's max_parameters, because of a long in_() list, the
+        list is split up, and the rows of one query per chunk are returned
+        in turn. Each chunk is ordered separately, and queries with a
+        limit() are never split."""
+        queries = self._split()
+        if queries is None:
+            return FilterableQuery.iter_rows(self)
+        return itertools.chain.from_iterable(q.iter_rows() for q in queries)
+
+    def _split(self, reserved=0):
+        # Splits the longest in_() list so that, along with reserved other
+        # variables, each query fits in max_parameters.
+        limit = self.table.database.adapter.max_parameters - reserved
+        variables = len(self.condition_variables)
+        if variables <= limit or self.limit_range or not self.in_conditions:
+            return None
+        key = max(self.in_conditions,
+                  key=lambda k: len(self.conditions[self.in_conditions[k]]))
+        values = self.conditions[self.in_conditions[key]]
+        size = limit - (variables - len(values))
+        if size < 1:
+            return None
+        return [self._clone().filter(**{key: in_(values[i:i + size])})
+                for i in range(0, len(values), size)]
+
+    def _clone(self):
+        query = copy.copy(self)
+        query.conditions = dict(self.conditions)
+        query.in_conditions = dict(self.in_conditions)
+        query._cache = None
+        return query
+
+    def __iter__(self):
+        resources = FilterableQuery.__iter__(self)
+        if not self.prefetch_relations:
+            return resources
+        return self._prefetched(resources)
+
+    def _prefetched(self, resources):
+        if self._cache is not None:
+            # Already prefetched when the cache was filled.
+            for resource in self._cache:
+                yield resource
+            return
+        size = self.batch_size or self.table.database.adapter.arraysize
+        while True:
+            batch = list(itertools.islice(resources, size))
+            if not batch:
+                return
+            for name in self.prefetch_relations:
+                self.table.load_related(name, batch)
+            for resource in batch:
+                yield resource
+
+    def seek(self, after=None, key=None):
+        """Keyset pagination: only returns rows whose key (defaults to the
+        primary key) is greater than after, ordered by key. Unlike an
+        offset in limit(), the database can jump straight to the first
+        row through the key's index, so every page costs the same however
+        deep it is. Use it along with limit():
+
+            Select(table).seek(after=last_id).limit(100)
+
+        This is chainable."""
+        if key is None:
+            key = self.table.pk_field
+        if after is not None:
+            self.filter(**{key: gt(after)})
+        return self.order_by(key)
+
+    def iter_chunks(self, size, key=None):
+        """A generator yielding the results of this query as lists of at
+        most size Resources, each fetched with its own keyset query (see
+        seek()), so walking a whole table runs at a constant cost per
+        chunk. key defaults to the primary key, and must be unique and
+        part of the selected fields."""
+        if key is None:
+            key = self.table.pk_field
+        after = None
+        while True:
+            chunk = self._clone().seek(after, key).limit(size).cache
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                return
+            after = chunk[-1][key]
+
     @property
-    def statement(self):
-        return self.template.format(
+    def shape(self):
+        return FilterableQuery.shape.fget(self) + (tuple(self.select_fields),)
+
+    def compile(self):
+        offset, count = self.limit_range or (0, None)
+        return self.dialect.select(self.template, dict(
             select = ', '.join(self.select_fields) or '*',
             table = self.table,
             conditions = self.where_clause,
             order = self.order_by_clause,
-            limit = self.limit_clause,
-        ).strip()
+        ), offset, count)
 
     @property
     def variables(self):
-        return self.conditions.values()
+        return self.condition_variables
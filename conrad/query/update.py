@@ -4,26 +4,45 @@ from query import FilterableQuery
 class Update(FilterableQuery):
     """Implements an UPDATE query."""
 
-    template = 'UPDATE {table} SET {updates} {conditions}'
+    template = 'UPDATE {table} SET {updates} {output} {conditions} {returning}'
 
     def __init__(self, table=None, **kwargs):
         FilterableQuery.__init__(self, table)
         self.updates = kwargs
+        self.returning_style = None
 
     def set(self, **kwargs):
         """Similar to Insert.set(), this will update a column's value."""
         self.updates.update(kwargs)
         return self
 
+    def returning(self, style='returning'):
+        """Makes the statement return the updated rows, so execute()
+        returns them without another query. The style depends on the
+        database: 'returning' adds a RETURNING * clause (PostgreSQL,
+        SQLite), and 'output' an OUTPUT INSERTED.* clause (SQL Server).
+        This is chainable."""
+        if style not in ('returning', 'output'):
+            raise ValueError('style must be returning or output')
+        self.returning_style = style
+        return self
+
     @property
-    def statement(self):
+    def shape(self):
+        return FilterableQuery.shape.fget(self) + (tuple(self.updates.keys()),
+                                                   self.returning_style)
+
+    def compile(self):
         update_list = ['{} = {}'.format(k, self.placeholder) for k in self.updates.keys()]
+        style = self.returning_style
         return self.template.format(
             table = self.table,
             updates = ', '.join(update_list),
-            conditions = self.where_clause
+            output = 'OUTPUT INSERTED.*' if style == 'output' else '',
+            conditions = self.where_clause,
+            returning = 'RETURNING *' if style == 'returning' else '',
         ).strip()
 
     @property
     def variables(self):
-        return self.updates.values() + self.conditions.values()
+        return self.updates.values() + self.condition_variables
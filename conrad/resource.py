@@ -1,12 +1,196 @@
 import logging
-from UserDict import DictMixin
 
+from conrad import session
 from conrad.query import Select, Insert, Delete, Update
 
 logger = logging.getLogger(__name__)
 
 
-class Resource(DictMixin):
+class ResourceError(Exception):
+    pass
+
+
+class RowLayout(object):
+    """
+    The column names of a row, along with a name -> position index. All of
+    the Resources built from one query share a single RowLayout, so each
+    row only has to store its values.
+    """
+
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+
+    @classmethod
+    def from_description(cls, description):
+        """
+        Builds a layout from a DBAPI2.0 cursor.description.
+        """
+        return cls(d[0] for d in description)
+
+    def extended(self, name):
+        """
+        Returns a new layout, with name appended.
+        """
+        return RowLayout(self.names + (name,))
+
+
+class SlottedDictMixin(object):
+    """
+    The rest of the dict API, built on __getitem__, __setitem__,
+    __delitem__ and keys(), like UserDict.DictMixin. Unlike DictMixin, it
+    has empty __slots__, so subclasses which declare theirs don't get a
+    __dict__ per instance. Like dicts, these mappings compare by value,
+    and so aren't hashable.
+    """
+
+    __slots__ = ()
+
+    __hash__ = None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iterkeys(self):
+        return self.__iter__()
+
+    def iteritems(self):
+        for key in self:
+            yield key, self[key]
+
+    def itervalues(self):
+        for key, value in self.iteritems():
+            yield value
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def has_key(self, key):
+        return key in self
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def pop(self, key, *args):
+        if len(args) > 1:
+            raise TypeError('pop expected at most 2 arguments, got {}'.format(
+                    1 + len(args)))
+        try:
+            value = self[key]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+        del self[key]
+        return value
+
+    def popitem(self):
+        for key in self:
+            value = self[key]
+            del self[key]
+            return key, value
+        raise KeyError('popitem(): dictionary is empty')
+
+    def clear(self):
+        for key in self.keys():
+            del self[key]
+
+    def update(self, other=(), **kwargs):
+        if hasattr(other, 'keys'):
+            for key in other.keys():
+                self[key] = other[key]
+        else:
+            for key, value in other:
+                self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def copy(self):
+        return dict(self.iteritems())
+
+    def __eq__(self, other):
+        try:
+            return dict(self.iteritems()) == dict(other.items())
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __cmp__(self, other):
+        if other is None:
+            return 1
+        if isinstance(other, SlottedDictMixin):
+            other = dict(other.iteritems())
+        return cmp(dict(self.iteritems()), other)
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+
+class Attributes(SlottedDictMixin):
+    """
+    A live dict view of a Resource's columns and values. Setting an item
+    changes the Resource without marking the column dirty, like
+    Resource.assign().
+    """
+
+    __slots__ = ('resource',)
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    def __getitem__(self, key):
+        return self.resource[key]
+
+    def __setitem__(self, key, value):
+        self.resource._put(key, value, False)
+
+    def __delitem__(self, key):
+        del self.resource[key]
+
+    def keys(self):
+        return self.resource.keys()
+
+    def __iter__(self):
+        return iter(self.resource)
+
+    def __len__(self):
+        return len(self.resource)
+
+    def __contains__(self, key):
+        return key in self.resource
+
+
+class Resource(SlottedDictMixin):
     """
     This represents one row in a database table. It is essentially a
     dict which holds the key:value mappings for the row. The resource
@@ -26,78 +210,276 @@ class Resource(DictMixin):
         >>> resource.delete()
         >>> db['artist'].get(resource['id'])
         None
+
+    To keep rows small, a Resource only stores a sequence of values, and
+    a RowLayout mapping column names to positions which is shared with the
+    other rows of the same query. Changed columns are tracked as bits in an
+    integer, rather than in a second dict. The values are kept in slots,
+    so a Resource has no __dict__; SlottedDictMixin adds the rest of the
+    dict API. Like a dict, a Resource compares equal to any mapping with
+    the same items, and isn't hashable.
     """
 
+    __slots__ = ('table', 'new', '_layout', '_values', '_dirty', '_related',
+                 '__weakref__')
+
     def __init__(self, table, attributes={}):
         self.table = table
-        self.attributes = attributes
         self.new = True
-        self.dirty = {}
+        self._related = None
+        self.attributes = attributes
+
+    @classmethod
+    def from_row(cls, table, layout, values):
+        """
+        Builds a saved (not new) Resource straight from a row of values, in
+        the order given by layout. The values are only copied once the
+        resource is changed.
+        """
+        resource = cls.__new__(cls)
+        resource.table = table
+        resource.new = False
+        resource._layout = layout
+        resource._values = values
+        resource._dirty = 0
+        resource._related = None
+        return resource
+
+    @property
+    def attributes(self):
+        """
+        All of this resource's columns and values, as a live dict view,
+        see Attributes.
+        """
+        return Attributes(self)
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._layout = RowLayout(attributes.keys())
+        self._values = list(attributes.values())
+        self._dirty = 0
+
+    @property
+    def dirty(self):
+        """
+        A dict of the columns which were changed since the last save.
+        """
+        dirty, names, values = self._dirty, self._layout.names, self._values
+        return dict((names[i], values[i]) for i in range(len(names))
+                    if dirty & (1 << i))
+
+    @dirty.setter
+    def dirty(self, dirty):
+        self._dirty = 0
+        for key, value in dirty.items():
+            self._put(key, value, True)
 
     def __getitem__(self, key):
         """
-        This returns the current object's attribute, merged with the
-        dirty attributes. Getting a resource's key will always return the
-        in-memory version, which may be different from the on-disk version
-        if the resource is dirty or new.
+        This returns the current object's attribute. Getting a resource's
+        key will always return the in-memory version, which may be
+        different from the on-disk version if the resource is dirty or new.
         """
-        return dict(self.attributes.items() + self.dirty.items())[key]
+        return self._values[self._layout.index[key]]
 
     def __setitem__(self, key, value):
         """
         Sets an item, but only if the table has the required column. Will
         raise a KeyError if an invalid column is specified.
         """
-        if key not in self.table.columns:
+        if key not in self.table.describe():
             logger.error('Requested column {}.{} does not exist: {}'.format(
                 self.table, key, self.table.columns))
             raise KeyError('Table {} does not have a column named {}'.format(
                     self.table, key))
-        self.attributes[key] = value
-        self.dirty[key] = value
+        self._put(key, value, True)
+
+    def __delitem__(self, key):
+        i = self._layout.index[key]
+        names = self._layout.names
+        self._layout = RowLayout(names[:i] + names[i + 1:])
+        values = self._values = list(self._values)
+        del values[i]
+        dirty = self._dirty
+        self._dirty = (dirty & ((1 << i) - 1)) | ((dirty >> (i + 1)) << i)
+
+    def copy(self):
+        """
+        Returns a dict of this resource's columns and values.
+        """
+        return dict(self.items())
+
+    def assign(self, **kwargs):
+        """
+        Sets attributes to values which are already in the database, so
+        unlike setting items, this doesn't make the resource dirty.
+        """
+        for key, value in kwargs.items():
+            self._put(key, value, False)
+
+    def _put(self, key, value, dirty):
+        values = self._values
+        if type(values) is not list:
+            values = self._values = list(values)
+        i = self._layout.index.get(key)
+        if i is None:
+            self._layout = self._layout.extended(key)
+            i = len(values)
+            values.append(value)
+        else:
+            values[i] = value
+        if dirty:
+            self._dirty |= 1 << i
+
+    def related(self, name):
+        """
+        Returns the related Resource for a table this one references, e.g.
+        album.related('artist'), or the list of Resources referencing this
+        one, e.g. artist.related('albums'). The relation is loaded on first
+        use and then kept; to load it for many resources in one query, use
+        Select.prefetch().
+        """
+        if self._related is None or name not in self._related:
+            self.table.load_related(name, [self])
+        return self._related[name]
+
+    def attach(self, name, value):
+        """
+        Sets the loaded value of the relation called name.
+        """
+        if self._related is None:
+            self._related = {}
+        self._related[name] = value
 
     def keys(self):
-        return self.attributes.keys()
+        return list(self._layout.names)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._layout.names, self._values)
+
+    def __iter__(self):
+        return iter(self._layout.names)
+
+    iterkeys = __iter__
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._layout.names)
+
+    def __contains__(self, key):
+        return key in self._layout.index
+
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        i = self._layout.index.get(key)
+        if i is None:
+            return default
+        return self._values[i]
+
+    def update(self, other=(), **kwargs):
+        for key, value in dict(other, **kwargs).items():
+            self[key] = value
 
     @property
     def save_required(self):
         """
         Returns True if the resource is dirty or new.
         """
-        return bool(self.dirty) or self.new
+        return bool(self._dirty) or self.new
 
     @property
     def pk(self):
         """
         Returns this object's primary key.
         """
-        return self.attributes[self.table.pk_field]
+        return self[self.table.pk_field]
 
-    def save(self):
+    def save(self, mode=None):
         """
         Saves the resource. Does an INSERT if the resource is new (e.g.
         one that was just created, but has not been saved yet) and does an
         UPDATE if the object already exists but has been changed.
+
+        mode decides how the resource is refreshed after an UPDATE, and
+        defaults to the table's save_mode:
+
+            'reload'     reload() the row with a SELECT, picking up any
+                         values computed by the database (the default).
+            'trust'      keep the values which were just written, without
+                         another query. The UPDATE's errors are raised,
+                         and a ResourceError if it doesn't match exactly
+                         one row.
+            'returning'  read the row back in the UPDATE statement itself,
+                         if the adapter's dialect has a returning_style,
+                         and reload
+                         otherwise.
         """
-        if not self.dirty and not self.new:
+        mode = mode or self.table.save_mode
+        if mode not in ('reload', 'trust', 'returning'):
+            raise ValueError('Unknown save mode: {}'.format(mode))
+        if not self._dirty and not self.new:
             return False
         else:
             if self.new:
                 # This resource is new, do an INSERT
-                self.dirty = {}
+                q = Insert(self.table).set(**self.attributes)
+                pk = q.execute()
+                self._dirty = 0
                 self.new = False
-                pk = Insert(self.table).set(**self.attributes).execute()
-                self.attributes[self.table.pk_field] = pk
+                if q.row is not None:
+                    self._layout = self.table.layout(q.row.cursor_description)
+                    self._values = q.row
+                else:
+                    self._put(self.table.pk_field, pk, False)
+                identity_map = session.current()
+                if identity_map is not None:
+                    identity_map.add(self)
                 return self
             else:
                 # This resource is not new, do an UPDATE
                 q = Update(self.table).filter(**{self.table.pk_field:self.pk})
                 q.set(**self.dirty)
+                style = self.table.database.adapter.dialect.returning_style
+                if mode == 'returning' and style:
+                    rows = q.returning(style).execute()
+                    if rows:
+                        self._layout = self.table.layout(rows[0].cursor_description)
+                        self._values = rows[0]
+                        self._dirty = 0
+                        self._related = None
+                        return self
+                    return self.reload()
+                if mode == 'trust':
+                    # Nothing reads the row back, so make sure the UPDATE
+                    # actually ran; -1 means the driver can't tell.
+                    with self.table.database.adapter.transaction():
+                        count = q.execute()
+                        if count not in (1, -1):
+                            raise ResourceError(
+                                'Invalid number of rows updated: {}'.format(
+                                    count))
+                    self._dirty = 0
+                    return self
                 q.execute()
                 self.reload()
-                self.dirty = {}
                 return self
 
+    def asave(self):
+        """
+        Like save(), but runs on the adapter's executor, and returns a
+        Future for the result.
+        """
+        return self.table.database.adapter.submit(self.save)
+
     def delete(self, force=False):
         """
         Deletes this resource from the database. If force=True, it will
@@ -105,21 +487,28 @@ class Resource(DictMixin):
         """
         if not force:
             q = Select(self.table).filter(**{self.table.pk_field:self.pk})
-            if len(q) != 1:
+            if q.count() != 1:
                 raise ResourceError('Invalid number of resources returned: {} {}'.format(
                         q.statement, q.variables))
         d = Delete(self.table).filter(**{self.table.pk_field:self.pk})
         d.execute()
+        identity_map = session.current()
+        if identity_map is not None:
+            identity_map.remove(self)
 
     def reload(self):
         """
         Reloads the resource's attributes from disk. This gets called
         after an update, to make sure the attributes are all in sync. You
         can call this manually if you are changing data outside of conrad.
+        The row is always read from the database, not the result cache.
         """
         q = Select(self.table).filter(**{self.table.pk_field:self.pk})
+        q.use_identity_map = False
+        q.use_cache = False
         obj = q[0]
-        self.attributes = obj.attributes
-        self.dirty = {}
+        self._layout, self._values = obj._layout, obj._values
+        self._dirty = 0
+        self._related = None
         self.new = False
         return self
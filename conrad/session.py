@@ -0,0 +1,93 @@
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityMap(object):
+    """
+    Keeps track of the Resources which have been loaded, so that each row
+    is only represented by one Resource. Resources are keyed on their
+    database, table and primary key, and held with weak references: once
+    nothing else uses a Resource, it drops out of the map.
+
+    You don't usually use this directly. Instead, open a session with
+    Database.session() (or session() from this module), and Table.get()
+    and query iteration will use the session's map:
+
+        with db.session():
+            a = db['artist'].get(1)
+            b = db['artist'].get(1)     # no query, and a is b
+    """
+
+    def __init__(self):
+        self._resources = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def key(table, pk):
+        # Tables in different Databases can share a name.
+        return (id(table.database), table.table, pk)
+
+    def get(self, table, pk):
+        """
+        Returns the Resource for pk in table, or None if it isn't loaded.
+        """
+        return self._resources.get(self.key(table, pk))
+
+    def add(self, resource):
+        """
+        Adds a resource to the map, unless one with the same key is
+        already there. Returns whichever resource ends up in the map.
+        """
+        key = self.key(resource.table, resource.pk)
+        existing = self._resources.get(key)
+        if existing is not None:
+            return existing
+        self._resources[key] = resource
+        return resource
+
+    def remove(self, resource):
+        self._resources.pop(self.key(resource.table, resource.pk), None)
+
+    def clear(self):
+        self._resources.clear()
+
+    def __len__(self):
+        return len(self._resources)
+
+
+_local = threading.local()
+
+
+def current():
+    """
+    Returns the IdentityMap of the innermost session open on this thread,
+    or None if there isn't one.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+@contextmanager
+def session(identity_map=None):
+    """
+    Opens a session (a unit of work) on the current thread, and yields its
+    IdentityMap. While the session is open, each (table, pk) row is loaded
+    once: Table.get() returns the already loaded Resource without a round
+    trip, and queries reuse the Resources already in the map. Sessions can
+    be nested; each gets its own map.
+    """
+    if identity_map is None:
+        identity_map = IdentityMap()
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(identity_map)
+    try:
+        yield identity_map
+    finally:
+        stack.pop()
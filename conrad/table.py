@@ -1,7 +1,8 @@
 import logging
 
-from conrad.query import Select
-from conrad.resource import Resource
+from conrad import session
+from conrad.query import Select, Insert, in_
+from conrad.resource import Resource, RowLayout
 
 
 logger = logging.getLogger(__name__)
@@ -29,8 +30,13 @@ class Table(object):
     A table will often return Queries, which are made up of many
     lazy-loaded Resources. Some methods -- such as get() -- return a single
     Resource. Think of a Table as a way of finding and managing Resources.
+
+    save_mode is the default mode of Resource.save() for this table's
+    resources; set it on the class to change it everywhere.
     """
 
+    save_mode = 'reload'
+
     def __init__(self, database, table, catalog='', schema=''):
         logger.debug('Defining table {} with catalog {} and schema {}'.format(
                 table, catalog, schema))
@@ -43,32 +49,32 @@ class Table(object):
         else:
             self.escaped_table = database.adapter.escape(table)
         self.database = database
-        #self.rescan()
-        self._columns = None
-        self._schema_dict = {}
+
+    def describe(self):
+        """
+        Returns the adapter's description of this table's columns. The
+        adapter caches this, so it is cheap to call repeatedly.
+        """
+        return self.database.adapter.describe(
+                self.table, self.catalog, self.schema)
 
     @property
     def columns(self):
-        if self._columns is None:
-            self.rescan()
-        return self._columns
+        return self.describe().keys()
 
     @property
     def schema_dict(self):
-        if self._schema_dict:
-            return self._schema_dict
-        for col, info in self.database.adapter.describe(
-                self.table, self.catalog, self.schema).items():
-            self._schema_dict[col] = info['type']
-        return self._schema_dict
+        return dict((col, info['type'])
+                    for col, info in self.describe().items())
 
     def rescan(self):
         """
-        Rescans the tables column listing. These values are used for
-        validation checking.
+        Drops the cached metadata (columns, primary key, foreign keys) for
+        this table, and reloads the column listing. These values are used
+        for validation checking.
         """
-        self._columns = self.database.adapter.describe(
-                self.table, self.catalog, self.schema).keys()
+        self.database.adapter.invalidate(self.table)
+        self.describe()
 
     def filter(self, **kwargs):
         """
@@ -79,13 +85,51 @@ class Table(object):
 
     def get(self, pk):
         """
-        Gets a specific entry in the table by primary key.
+        Gets a specific entry in the table by primary key. Inside of a
+        session, a row which was already loaded is returned straight from
+        the identity map, without a query.
         """
+        identity_map = session.current()
+        if identity_map is not None:
+            resource = identity_map.get(self, pk)
+            if resource is not None:
+                return resource
         try:
             return Select(self).filter(**{self.pk_field:pk})[0]
         except IndexError:
             return None
 
+    def get_many(self, pks):
+        """
+        Gets the rows for many primary keys at once, and returns a dict
+        of pk:Resource, leaving out the keys which don't exist. The rows
+        are loaded with WHERE pk IN (...) queries, split up to fit the
+        adapter's max_parameters, rather than one query per key. Inside of
+        a session, rows which are already loaded aren't queried again.
+        """
+        results = {}
+        missing = set()
+        identity_map = session.current()
+        for pk in pks:
+            resource = None
+            if identity_map is not None:
+                resource = identity_map.get(self, pk)
+            if resource is not None:
+                results[pk] = resource
+            else:
+                missing.add(pk)
+        if missing:
+            for resource in Select(self).filter(**{self.pk_field: in_(missing)}):
+                results[resource.pk] = resource
+        return results
+
+    def aget(self, pk):
+        """
+        Like get(), but runs on the adapter's executor, and returns a
+        Future for the Resource.
+        """
+        return self.database.adapter.submit(self.get, pk)
+
     def new(self, **kwargs):
         """
         Create a new resource with the values set to **kwargs, but don't
@@ -93,12 +137,62 @@ class Table(object):
         """
         return Resource(self, kwargs)
 
+    def layout(self, description):
+        """
+        Returns a RowLayout for rows with the given cursor.description.
+        """
+        return RowLayout.from_description(description)
+
+    def from_row(self, layout, values):
+        """
+        Wraps a row of values, fetched from the database in the order given
+        by layout, in a Resource. This is what queries use to build their
+        results, skipping the keyword argument juggling of new().
+        """
+        return Resource.from_row(self, layout, values)
+
     def create(self, **kwargs):
         """
         Same as new(), but this will save the resource.
         """
         return self.new(**kwargs).save()
 
+    def bulk_create(self, rows, batch_size=1000, returning=False):
+        """
+        Inserts one row for each dict in rows, batch_size rows per
+        executemany() call, each batch committed once. Returns the number
+        of inserted rows. If returning is True, the generated keys are
+        read back, and saved Resources are returned instead. Where the
+        dialect can return the inserted rows, each batch is inserted with
+        a few multi-row INSERTs (see Insert.execute()), and the Resources
+        are built from the returned rows; otherwise the rows are inserted
+        one at a time.
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        rows = list(rows)
+        created = [] if returning else 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            q = Insert(self).many(batch)
+            result = q.execute(returning=returning)
+            if returning and q.returned_rows is not None:
+                layout = None
+                for values in q.returned_rows:
+                    if layout is None:
+                        layout = self.layout(values.cursor_description)
+                    created.append(self.from_row(layout, values))
+            elif returning:
+                pk_field = self.pk_field
+                for row, pk in zip(batch, result):
+                    resource = self.new(**dict(row))
+                    resource.assign(**{pk_field: pk})
+                    resource.new = False
+                    created.append(resource)
+            else:
+                created += result
+        return created
+
     def all(self):
         """
         Returns all resources in the table.
@@ -112,6 +206,63 @@ class Table(object):
         """
         return self.database.adapter.pk(self.table)
 
+    @property
+    def fks(self):
+        """
+        The foreign keys referencing this table, see DBAPI2.fks().
+        """
+        return self.database.adapter.fks(self.table)
+
+    @property
+    def references(self):
+        """
+        The foreign keys in this table, pointing at other tables, see
+        DBAPI2.references().
+        """
+        return self.database.adapter.references(self.table)
+
+    def relation(self, name):
+        """
+        Looks up the relation called name, which is either a table this
+        table references (album -> artist), or a table referencing this
+        one, optionally pluralized (artist -> albums). Returns a tuple of
+        (many, column, related table, related column), where many is True
+        if there can be more than one related row. Raises KeyError for
+        unknown relations.
+        """
+        references = self.references
+        if name in references:
+            relation, many = references[name], False
+        else:
+            relation, many = self.fks.get(name), True
+        if relation is None:
+            raise KeyError('Table {} has no relation named {}'.format(
+                    self.table, name))
+        to_table, to_column = relation['to']
+        return many, relation['from'][1], self.database[to_table], to_column
+
+    def load_related(self, name, resources):
+        """
+        Loads the relation called name for all of resources at once, with
+        one WHERE column IN (...) query per max_parameters keys, and
+        attaches the related Resource (or list of Resources) to each one.
+        See Resource.related().
+        """
+        many, column, table, to_column = self.relation(name)
+        keys = list(set(r.get(column) for r in resources) - set([None]))
+        related = {}
+        if keys:
+            for row in Select(table).filter(**{to_column: in_(keys)}):
+                if many:
+                    related.setdefault(row[to_column], []).append(row)
+                else:
+                    related[row[to_column]] = row
+        for resource in resources:
+            value = related.get(resource.get(column))
+            if many:
+                value = list(value or [])
+            resource.attach(name, value)
+
     def __call__(self, **kwargs):
         """
         Convenience method to make a new resource for this table. Simply
@@ -29,7 +29,9 @@ app = flask.Flask('conrad_test')
 def get_artist(id):
     if not artist_map.has_key(id):
         flask.abort(404)
-    return flask.jsonify(artist_map[id])
+    response = flask.jsonify(artist_map[id])
+    response.add_etag()
+    return response.make_conditional(flask.request)
 
 @app.route('/api/artist', methods=['POST'])
 def create_artist():
@@ -61,4 +63,16 @@ def delete_artist(id):
 def list_artists():
     return flask.jsonify(artist_map)
 
+@app.route('/api/artist_pages')
+def page_artists():
+    page = int(flask.request.args.get('page', 1))
+    per_page = int(flask.request.args.get('per_page', 2))
+    ids = sorted(artist_map.keys())
+    start = (page - 1) * per_page
+    body = {'items': [artist_map[id] for id in ids[start:start + per_page]]}
+    if start + per_page < len(ids):
+        body['next'] = '/api/artist_pages?page={}&per_page={}'.format(
+                page + 1, per_page)
+    return flask.jsonify(body)
+
 if __name__ == '__main__': app.run()
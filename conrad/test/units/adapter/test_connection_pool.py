@@ -0,0 +1,125 @@
+import threading
+import time
+
+from nose.tools import raises
+
+from conrad.adapter import ConnectionPool, PoolError
+
+
+class MockCursor(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, *args):
+        if self.connection.closed or self.connection.dead:
+            raise Exception('connection is gone')
+
+    def close(self):
+        return
+
+
+class MockConnection(object):
+
+    def __init__(self):
+        self.closed = False
+        self.dead = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        if self.closed or self.dead:
+            raise Exception('connection is gone')
+        return MockCursor(self)
+
+    def rollback(self):
+        if self.closed or self.dead:
+            raise Exception('connection is gone')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(object):
+
+    def setup(self):
+        self.opened = []
+
+    def factory(self):
+        connection = MockConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_prewarm(self):
+        pool = ConnectionPool(self.factory, min_size=3, max_size=5)
+        assert len(self.opened) == 3
+        assert pool.stats['idle'] == 3
+
+    def test_checkout_reuses(self):
+        pool = ConnectionPool(self.factory, min_size=1, max_size=5)
+        with pool.checkout() as first:
+            pass
+        with pool.checkout() as second:
+            pass
+        assert first is second
+        assert len(self.opened) == 1
+        assert pool.stats['checkouts'] == 2
+
+    def test_grows_to_max(self):
+        pool = ConnectionPool(self.factory, min_size=0, max_size=2)
+        a = pool.get()
+        b = pool.get()
+        assert a is not b
+        assert pool.stats['in_use'] == 2
+
+    @raises(PoolError)
+    def test_timeout(self):
+        pool = ConnectionPool(self.factory, min_size=0, max_size=1,
+                timeout=0.05)
+        pool.get()
+        pool.get()
+
+    def test_wait_for_return(self):
+        pool = ConnectionPool(self.factory, min_size=1, max_size=1)
+        connection = pool.get()
+        def give_back():
+            time.sleep(0.05)
+            pool.put(connection)
+        threading.Thread(target=give_back).start()
+        assert pool.get() is connection
+        assert pool.stats['waits'] == 1
+        assert pool.stats['max_wait'] > 0
+
+    def test_dead_connection_replaced(self):
+        pool = ConnectionPool(self.factory, min_size=1, max_size=1, ping='SELECT 1')
+        self.opened[0].dead = True
+        connection = pool.get()
+        assert connection is not self.opened[0]
+        assert self.opened[0].closed
+
+    def test_idle_eviction(self):
+        pool = ConnectionPool(self.factory, min_size=1, max_size=3,
+                idle_timeout=0)
+        a, b = pool.get(), pool.get()
+        pool.put(a)
+        pool.put(b)
+        time.sleep(0.01)
+        pool.get()
+        assert a.closed or b.closed
+        assert pool.stats['size'] == 1
+
+    def test_put_rolls_back(self):
+        pool = ConnectionPool(self.factory, min_size=0, max_size=2)
+        with pool.checkout() as connection:
+            pass
+        assert connection.rollbacks == 1
+        connection = pool.get()
+        connection.dead = True
+        pool.put(connection)
+        assert connection.closed
+        assert pool.stats['size'] == 0
+
+    def test_close(self):
+        pool = ConnectionPool(self.factory, min_size=2, max_size=2)
+        pool.close()
+        assert all(c.closed for c in self.opened)
@@ -0,0 +1,40 @@
+import time
+
+from conrad.adapter import MetadataCache
+
+
+class TestMetadataCache(object):
+
+    def setup(self):
+        self.cache = MetadataCache()
+        self.loads = 0
+
+    def loader(self):
+        self.loads += 1
+        return 'id'
+
+    def test_loads_once(self):
+        assert self.cache.get('artist', 'pk', self.loader) == 'id'
+        assert self.cache.get('artist', 'pk', self.loader) == 'id'
+        assert self.loads == 1
+
+    def test_invalidate_table(self):
+        self.cache.get('artist', 'pk', self.loader)
+        self.cache.get('album', 'pk', self.loader)
+        self.cache.invalidate('artist')
+        self.cache.get('artist', 'pk', self.loader)
+        self.cache.get('album', 'pk', self.loader)
+        assert self.loads == 3
+
+    def test_invalidate_all(self):
+        self.cache.get('artist', 'pk', self.loader)
+        self.cache.invalidate()
+        self.cache.get('artist', 'pk', self.loader)
+        assert self.loads == 2
+
+    def test_ttl(self):
+        self.cache.ttl = 0.01
+        self.cache.get('artist', 'pk', self.loader)
+        time.sleep(0.02)
+        self.cache.get('artist', 'pk', self.loader)
+        assert self.loads == 2
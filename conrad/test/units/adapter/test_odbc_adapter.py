@@ -1,11 +1,234 @@
+import sqlite3
+
 from conrad.adapter import ODBC
+from conrad.dialect import Dialect, SQLite
 from conrad.test.units.adapter import GenericAdapter
 from conrad.test import resource, create_test_database
 
 
+def submit_many(adapter):
+    # Runs more calls than there are workers, and returns the connections
+    # they ran on.
+    connections = []
+    adapter.hooks.add('after_execute',
+                      lambda e: connections.append(e.connection))
+    ids = [i % 4 + 1 for i in range(10)]
+    futures = [adapter.submit(adapter.find, 'artist', {'id': i}) for i in ids]
+    assert [f.result(5)[0]['id'] for f in futures] == ids
+    assert len(set(map(id, connections))) <= adapter.executor_workers
+    return connections
+
+
 class TestODBCAdapter(GenericAdapter):
 
     def setup(self):
         self.test_db_path = create_test_database()
         self.adapter = ODBC('DRIVER={{SQLite3}};DATABASE={}'.format(
                 self.test_db_path))
+
+    def test_dialect_detected(self):
+        assert isinstance(self.adapter.dialect, SQLite)
+        assert self.adapter.escape('artist') == '"artist"'
+
+    def test_hooks(self):
+        events = []
+        for event in ('before_execute', 'after_execute', 'on_error'):
+            self.adapter.hooks.add(event,
+                    lambda e, event=event: events.append((event, e)))
+        self.adapter.execute('SELECT * FROM artist WHERE id < ?', 3)
+        (before, execution), (after, same) = events
+        assert (before, after) == ('before_execute', 'after_execute')
+        assert execution is same
+        assert execution.parameters == (3,)
+        assert execution.rows == 2
+        assert execution.duration >= 0
+        assert execution.connection is self.adapter.connection
+        del events[:]
+        self.adapter.execute('SELECT * FROM nothing')
+        assert events[-1][0] == 'on_error'
+        assert events[-1][1].error is not None
+
+    def test_hooks_on_stream(self):
+        executions = []
+        self.adapter.hooks.add('after_execute', executions.append)
+        rows = self.adapter.stream('SELECT * FROM artist')
+        rows.next()
+        rows.close()
+        assert executions[0].rows == 4
+
+    def test_hooks_on_stream_error(self):
+        class Cursor(object):
+            # Fails on the second batch.
+            def __init__(self, cursor):
+                self.cursor, self.fetches = cursor, 0
+            def __getattr__(self, name):
+                return getattr(self.cursor, name)
+            def fetchmany(self, size):
+                self.fetches += 1
+                if self.fetches > 1:
+                    raise RuntimeError('connection lost')
+                return self.cursor.fetchmany(size)
+        class Connection(object):
+            def __init__(self, connection):
+                self.connection = connection
+            def __getattr__(self, name):
+                return getattr(self.connection, name)
+            def cursor(self):
+                return Cursor(self.connection.cursor())
+        self.adapter.connection = Connection(self.adapter.connection)
+        events = []
+        for event in ('after_execute', 'on_error'):
+            self.adapter.hooks.add(event,
+                    lambda e, event=event: events.append((event, e.rows)))
+        rows = self.adapter.stream('SELECT * FROM artist', arraysize=2)
+        try:
+            list(rows)
+            assert False, 'stream should have raised'
+        except RuntimeError:
+            pass
+        assert events == [('on_error', 2)]
+
+    def test_stream(self):
+        rows = self.adapter.stream('SELECT * FROM artist ORDER BY id', arraysize=2)
+        first = rows.next()
+        assert self.adapter.result_dict(first)['name'] == 'James Brown'
+        assert len(list(rows)) == 3
+
+    def test_metadata_cached(self):
+        assert self.adapter.pk('artist') == 'id'
+        assert 'name' in self.adapter.describe('artist')
+        assert ('artist', 'pk') in self.adapter.metadata._entries
+        self.adapter.invalidate('artist')
+        assert ('artist', 'pk') not in self.adapter.metadata._entries
+
+    def test_cursor_reuse(self):
+        sql = 'SELECT * FROM artist WHERE id = ?'
+        self.adapter.execute(sql, 1)
+        connection = self.adapter.connection
+        cursor = self.adapter._cursors[id(connection)][1][sql]
+        assert self.adapter.execute(sql, 2)[0][1] == 'Richard D. James'
+        assert self.adapter._cursors[id(connection)][1][sql] is cursor
+
+    def test_update(self):
+        assert self.adapter.update('artist', {'name': 'JB'}, {'id': 1}) == 1
+        assert self.count('JB') == 1
+        assert self.adapter.delete('artist', {'name': 'JB'}) == 1
+        assert self.count('JB') == 0
+
+    def test_insert_key_styles(self):
+        for style in ('query', 'lastrowid', 'returning'):
+            self.adapter.dialect.insert_key_style = style
+            created = self.adapter.create('artist', {'name': style})
+            assert created[0]['name'] == style, style
+            assert self.adapter.find('artist', {'id': created[0]['id']})
+
+    def test_lastrowid_fallback(self):
+        class Cursor(object):
+            # A pyodbc cursor has no lastrowid.
+            def __init__(self, cursor):
+                self.cursor = cursor
+            def execute(self, sql, *args):
+                return self.cursor.execute(sql, *args)
+            def fetchone(self):
+                return self.cursor.fetchone()
+        self.adapter.dialect.insert_key_style = 'lastrowid'
+        with self.adapter.checkout() as connection:
+            cursor = Cursor(connection.cursor())
+            cursor.execute('INSERT INTO artist (name) VALUES (?)', 'Low')
+            key, row = self.adapter._inserted(cursor, 'id')
+            connection.commit()
+        assert self.adapter.find('artist', {'id': key})[0]['name'] == 'Low'
+
+    def test_create_without_key(self):
+        self.adapter.dialect = Dialect()
+        try:
+            self.adapter.create('artist', {'name': 'Low'})
+        except Exception, e:
+            assert 'no key was returned' in str(e)
+        else:
+            assert False, 'create() returned without a key'
+
+    def count(self, name):
+        return len(self.adapter.find('artist', {'name': name}))
+
+    def test_transaction_commit(self):
+        with self.adapter.transaction():
+            self.adapter.execute('INSERT INTO artist (name) VALUES (?)', 'Low')
+            assert self.adapter.in_transaction
+        assert not self.adapter.in_transaction
+        assert self.count('Low') == 1
+
+    def test_transaction_rollback(self):
+        try:
+            with self.adapter.transaction():
+                self.adapter.execute('INSERT INTO artist (name) VALUES (?)', 'Low')
+                raise RuntimeError('abort')
+        except RuntimeError:
+            pass
+        assert self.count('Low') == 0
+
+    def test_savepoint(self):
+        with self.adapter.transaction():
+            self.adapter.execute('INSERT INTO artist (name) VALUES (?)', 'Low')
+            try:
+                with self.adapter.transaction():
+                    self.adapter.execute('INSERT INTO artist (name) VALUES (?)', 'Hum')
+                    raise RuntimeError('abort')
+            except RuntimeError:
+                pass
+        assert self.count('Low') == 1
+        assert self.count('Hum') == 0
+
+    def test_reads_release_locks(self):
+        assert self.adapter.find('artist', {'id': 1})
+        other = sqlite3.connect(self.test_db_path, timeout=0.1)
+        try:
+            other.execute("INSERT INTO artist (name) VALUES ('Low')")
+            other.commit()
+        finally:
+            other.close()
+        assert self.count('Low') == 1
+
+    def test_submit_own_connections(self):
+        self.adapter.executor_workers = 2
+        connections = submit_many(self.adapter)
+        assert all(c is not self.adapter.connection for c in connections)
+        self.adapter.shutdown()
+
+
+class TestPooledODBCAdapter(GenericAdapter):
+
+    def setup(self):
+        self.test_db_path = create_test_database()
+        self.adapter = ODBC('DRIVER={{SQLite3}};DATABASE={}'.format(
+                self.test_db_path), pool_size=2)
+        self.adapter.executor_workers = 2
+
+    def test_pool(self):
+        assert self.adapter.pool.stats['size'] == 1
+        self.adapter.find('artist')
+        assert self.adapter.pool.stats['checkouts'] > 0
+
+    def test_submit(self):
+        future = self.adapter.submit(self.adapter.find, 'artist', {'id': 1})
+        assert future.result(5)[0]['name'] == 'James Brown'
+        assert self.adapter.pool.stats['in_use'] <= 2
+
+    def test_submit_own_connections(self):
+        submit_many(self.adapter)
+        assert self.adapter.pool.stats['in_use'] == 0
+        assert self.adapter.find('artist', {'id': 1})
+        self.adapter.shutdown()
+
+    def test_nested_streams_share_connection(self):
+        adapter = ODBC('DRIVER={{SQLite3}};DATABASE={}'.format(
+                self.test_db_path), pool_size=1, pool_timeout=1)
+        names = []
+        for album in adapter.stream('SELECT artist_id FROM album'):
+            for artist in adapter.stream(
+                    'SELECT name FROM artist WHERE id = ?', album[0]):
+                names.append(artist[0])
+            assert adapter.pool.stats['in_use'] == 1
+        assert len(names) == 5
+        assert adapter.pool.stats['in_use'] == 0
+        adapter.pool.close()
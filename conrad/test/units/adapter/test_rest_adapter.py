@@ -4,6 +4,7 @@ import subprocess
 import time
 
 from conrad.adapter import Rest
+from conrad.cache import ResponseCache
 from conrad.test import resource
 from conrad.test.units.adapter import GenericAdapter
 
@@ -16,4 +17,24 @@ class TestRestAdapter(GenericAdapter):
 
     def teardown(self):
         os.kill(self.api_server.pid, signal.SIGTERM)
-        time.sleep(1)
\ No newline at end of file
+        time.sleep(1)
+
+    def test_find_many(self):
+        res = self.adapter.find_many('artist', [1, 3, 99])
+        assert res[1]['name'] == 'James Brown'
+        assert res[3]['name'] == 'Fugazi'
+        assert 99 not in res
+
+    def test_iterate(self):
+        records = self.adapter.iterate('artist_pages', page_size=3)
+        assert records.next()['name'] == 'James Brown'
+        assert [r['id'] for r in records][:3] == [2, 3, 4]
+
+    def test_response_cache(self):
+        self.adapter.response_cache = ResponseCache()
+        first = self.adapter.find('artist', {'id': 4})
+        assert self.adapter.find('artist', {'id': 4}) == first
+        assert self.adapter.response_cache.hits == 1
+        self.adapter.update('artist', {'name': 'Sly Stone'}, {'id': 4})
+        assert self.adapter.find('artist', {'id': 4})[0]['name'] == 'Sly Stone'
+        assert self.adapter.response_cache.hits == 1
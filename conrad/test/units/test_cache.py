@@ -0,0 +1,91 @@
+import time
+
+from conrad.cache import ResultCache, ResponseCache
+
+
+class TestResultCache(object):
+
+    def setup(self):
+        self.cache = ResultCache(max_entries=2)
+
+    def test_hit_miss(self):
+        assert self.cache.get('artist', 'SELECT 1', [1]) is None
+        self.cache.set('artist', 'SELECT 1', [1], [(1,)])
+        assert self.cache.get('artist', 'SELECT 1', [1]) == [(1,)]
+        assert self.cache.get('artist', 'SELECT 1', [2]) is None
+        assert self.cache.hits == 1
+        assert self.cache.misses == 2
+
+    def test_lru(self):
+        self.cache.set('artist', 'a', [], [1])
+        self.cache.set('artist', 'b', [], [2])
+        self.cache.get('artist', 'a', [])
+        self.cache.set('artist', 'c', [], [3])
+        assert self.cache.get('artist', 'a', []) == [1]
+        assert self.cache.get('artist', 'b', []) is None
+
+    def test_max_rows(self):
+        self.cache.max_rows = 2
+        self.cache.set('artist', 'a', [], [1, 2, 3])
+        assert self.cache.get('artist', 'a', []) is None
+
+    def test_stale_version(self):
+        version = self.cache.version
+        self.cache.invalidate('album')
+        self.cache.set('artist', 'a', [], [1], version)
+        assert self.cache.get('artist', 'a', []) is None
+        self.cache.set('artist', 'a', [], [1], self.cache.version)
+        assert self.cache.get('artist', 'a', []) == [1]
+
+    def test_invalidate(self):
+        self.cache.set('artist', 'a', [], [1])
+        self.cache.set('album', 'b', [], [2])
+        self.cache.invalidate('artist')
+        assert self.cache.get('artist', 'a', []) is None
+        assert self.cache.get('album', 'b', []) == [2]
+
+    def test_table_ttl(self):
+        self.cache.table_ttls = {'artist': 0.01}
+        self.cache.set('artist', 'a', [], [1])
+        self.cache.set('album', 'b', [], [2])
+        time.sleep(0.02)
+        assert self.cache.get('artist', 'a', []) is None
+        assert self.cache.get('album', 'b', []) == [2]
+
+
+class TestResponseCache(object):
+
+    def setup(self):
+        self.cache = ResponseCache(max_entries=2)
+
+    def test_conditional_headers(self):
+        assert self.cache.headers('artist/1', None) == {}
+        body = self.cache.response('artist', '1', 'artist/1', None, 200,
+                                   {'ETag': '"abc"'}, '{"id": 1}')
+        assert body == '{"id": 1}'
+        assert self.cache.headers('artist/1', None) == {'If-None-Match': '"abc"'}
+
+    def test_not_modified(self):
+        self.cache.response('artist', '1', 'artist/1', None, 200,
+                            {'Last-Modified': 'yesterday'}, 'cached')
+        assert self.cache.response('artist', '1', 'artist/1', None, 304,
+                                   {}, '') == 'cached'
+        assert self.cache.hits == 1
+
+    def test_not_modified_evicted(self):
+        assert self.cache.response('artist', '1', 'artist/1', None, 304,
+                                   {}, '') is None
+
+    def test_uncacheable(self):
+        self.cache.response('artist', None, 'artist', None, 200, {}, '[]')
+        assert len(self.cache) == 0
+
+    def test_invalidate(self):
+        for path, id in (('artist/1', '1'), ('artist', None)):
+            self.cache.response('artist', id, path, None, 200,
+                                {'ETag': '"x"'}, 'x')
+        self.cache.invalidate('artist', '2')
+        assert self.cache.headers('artist/1', None)
+        assert not self.cache.headers('artist', None)
+        self.cache.invalidate('artist', '1')
+        assert len(self.cache) == 0
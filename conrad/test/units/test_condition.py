@@ -42,6 +42,18 @@ class TestLessThanOrEqualTo(object):
         assert 5 == lte.variable
 
 
+class TestIn(object):
+
+    def test_sqlgen(self):
+        in_ = query.in_([3, 1, 3, 2])
+        assert in_.statement == '{name} IN ({placeholder}, {placeholder}, {placeholder})'
+        assert in_.variables == [3, 1, 2]
+
+    def test_unhashable(self):
+        in_ = query.in_([[1], [2], [1], 3, 3])
+        assert in_.variables == [[1], [2], 3]
+
+
 class TestConditionFilterIntegration(object):
 
     def test_filtering(self):
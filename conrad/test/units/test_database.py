@@ -30,7 +30,53 @@ class TestDatabase(object):
     def test_rescan(self):
         db = Database(self.dsn)
         assert not db.has_key('testtable')
-        db.adapter.cursor.execute('CREATE TABLE testtable (id integer primary key, name string)')
+        db.adapter.execute('CREATE TABLE testtable (id integer primary key, name string)')
         db.rescan()
         assert db.has_key('testtable')
 
+    def test_lazy_lookup(self):
+        db = Database(self.dsn)
+        assert db['artist'].table == 'artist'
+        assert not db._scanned
+        assert 'album' in db.keys()
+        assert db._scanned
+
+    def test_missing_table(self):
+        db = Database(self.dsn)
+        assert not db.has_key('nosuchtable')
+
+    def test_snapshot(self):
+        snapshot = self.test_db + '.snapshot'
+        try:
+            db = Database(self.dsn, snapshot=snapshot)
+            assert os.path.exists(snapshot)
+            db = Database(self.dsn, snapshot=snapshot)
+            assert db.adapter.metadata._entries
+            assert db['artist'].pk_field == 'id'
+        finally:
+            os.unlink(snapshot)
+
+    def test_snapshot_skips_catalog(self):
+        snapshot = self.test_db + '.snapshot'
+        try:
+            Database(self.dsn, snapshot=snapshot)
+            db = Database(self.dsn, snapshot=snapshot)
+            def fail(name):
+                raise AssertionError('catalog lookup for {}'.format(name))
+            db.adapter._table_info = fail
+            assert db['artist'].table == 'artist'
+            assert db['album'].table == 'album'
+        finally:
+            os.unlink(snapshot)
+
+    def test_stale_snapshot(self):
+        snapshot = self.test_db + '.snapshot'
+        try:
+            with open(snapshot, 'w') as f:
+                f.write('{"version": -1}')
+            db = Database(self.dsn, snapshot=snapshot)
+            assert 'artist' in db.keys()
+            db.load_snapshot()
+        finally:
+            os.unlink(snapshot)
+
@@ -0,0 +1,51 @@
+from conrad.dialect import *
+
+
+TEMPLATE = 'SELECT {select} FROM {table} {conditions} {order} {limit}'
+PARTS = {'select': '*', 'table': 't', 'conditions': '', 'order': 'ORDER BY id ASC'}
+
+
+class TestDialect(object):
+
+    def test_detect(self):
+        assert isinstance(detect('Microsoft SQL Server'), SQLServer)
+        assert isinstance(detect('DB2/LINUXX8664'), DB2)
+        assert isinstance(detect('SQLite'), SQLite)
+        assert type(detect('Something Else')) is Dialect
+        assert type(detect(None)) is Dialect
+
+    def test_escape(self):
+        assert Dialect().escape('artist') == 'artist'
+        assert SQLite().escape('main.artist') == '"main"."artist"'
+        assert SQLServer().escape('[dbo].artist') == '[dbo].[artist]'
+        assert MySQL().escape('a`b') == '`a``b`'
+
+    def test_generic_limit(self):
+        sql = Dialect().select(TEMPLATE, PARTS, 5, 5)
+        assert sql.endswith('ORDER BY id ASC OFFSET 5 ROWS FETCH FIRST 5 ROWS ONLY')
+        assert Dialect().last_inserted_statement is None
+
+    def test_limit_offset(self):
+        sql = SQLite().select(TEMPLATE, PARTS, 20, 10)
+        assert sql.endswith('LIMIT 10 OFFSET 20')
+        assert SQLite().select(TEMPLATE, PARTS).endswith('ORDER BY id ASC')
+
+    def test_top(self):
+        sql = SQLServer().select(TEMPLATE, PARTS, 0, 10)
+        assert sql.startswith('SELECT TOP 10 * FROM t')
+        sql = SQLServer().select(TEMPLATE, dict(PARTS, order=''), 20, 10)
+        assert sql.endswith('ORDER BY (SELECT NULL) OFFSET 20 ROWS FETCH NEXT 10 ROWS ONLY')
+
+    def test_fetch_first(self):
+        sql = DB2().select(TEMPLATE, PARTS, 0, 10)
+        assert sql.endswith('ORDER BY id ASC FETCH FIRST 10 ROWS ONLY')
+
+    def test_rownum(self):
+        sql = Oracle().select(TEMPLATE, PARTS, 0, 10)
+        assert sql == 'SELECT * FROM (SELECT * FROM t  ORDER BY id ASC) WHERE ROWNUM <= 10'
+        sql = Oracle().select(TEMPLATE, dict(PARTS, conditions='WHERE a = ?'),
+                              20, 10)
+        assert sql.startswith('SELECT * FROM t WHERE ROWID IN (SELECT conrad_rid FROM ')
+        assert 'SELECT ROWID conrad_rid FROM t WHERE a = ? ORDER BY id ASC' in sql
+        assert 'WHERE ROWNUM <= 30) WHERE conrad_rn > 20) ORDER BY id ASC' in sql
+        assert sql.count('?') == 1
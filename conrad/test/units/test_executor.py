@@ -0,0 +1,67 @@
+import threading
+import time
+
+from nose.tools import raises
+
+from conrad.executor import Executor, Future
+
+
+class TestExecutor(object):
+
+    def setup(self):
+        self.executor = Executor(max_workers=2)
+
+    def teardown(self):
+        self.executor.shutdown()
+
+    def test_submit(self):
+        future = self.executor.submit(lambda a, b: a + b, 1, b=2)
+        assert future.result(1) == 3
+        assert future.done()
+
+    @raises(ZeroDivisionError)
+    def test_exception(self):
+        self.executor.submit(lambda: 1 / 0).result(1)
+
+    def test_bounded(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+        def work():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+        futures = [self.executor.submit(work) for i in range(6)]
+        for future in futures:
+            future.result(1)
+        assert max(peak) <= 2
+
+    def test_initializer(self):
+        started = []
+        executor = Executor(max_workers=3,
+                            initializer=lambda: started.append(1))
+        executor.submit(lambda: None).result(1)
+        executor.shutdown()
+        assert len(started) == 3
+
+    def test_initializer_error(self):
+        def initializer():
+            raise ValueError('no connection')
+        finalized = []
+        executor = Executor(max_workers=2, initializer=initializer,
+                            finalizer=lambda: finalized.append(1))
+        futures = [executor.submit(lambda: 1) for i in range(4)]
+        for future in futures:
+            assert isinstance(future.exception(1), ValueError)
+        executor.shutdown()
+        assert not finalized
+
+    def test_callback(self):
+        done = []
+        future = self.executor.submit(lambda: 5)
+        future.result(1)
+        future.add_done_callback(lambda f: done.append(f.result()))
+        assert done == [5]
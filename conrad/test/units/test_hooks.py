@@ -0,0 +1,36 @@
+from nose.tools import raises
+
+from conrad.hooks import Hooks
+
+
+class TestHooks(object):
+
+    def setup(self):
+        self.hooks = Hooks()
+        self.calls = []
+
+    def hook(self, execution):
+        self.calls.append(execution)
+
+    def test_active(self):
+        assert not self.hooks.active
+        self.hooks.add('after_execute', self.hook)
+        assert self.hooks.active
+        self.hooks.remove('after_execute', self.hook)
+        assert not self.hooks.active
+
+    def test_fire(self):
+        self.hooks.add('before_execute', self.hook)
+        self.hooks.fire('before_execute', 1)
+        self.hooks.fire('after_execute', 2)
+        assert self.calls == [1]
+
+    def test_hook_errors_ignored(self):
+        self.hooks.add('on_error', lambda execution: 1 / 0)
+        self.hooks.add('on_error', self.hook)
+        self.hooks.fire('on_error', 1)
+        assert self.calls == [1]
+
+    @raises(ValueError)
+    def test_unknown_event(self):
+        self.hooks.add('before_commit', self.hook)
@@ -0,0 +1,60 @@
+import json
+import os
+
+from conrad.test import create_test_database
+from conrad import Database, profile
+from conrad.profiler import normalize
+
+
+class TestProfiler(object):
+
+    def setup(self):
+        self.test_db = create_test_database()
+        self.db = Database('DRIVER={{SQLite3}};DATABASE={}'.format(self.test_db))
+
+    def teardown(self):
+        self.db.close()
+        os.unlink(self.test_db)
+
+    def test_normalize(self):
+        assert normalize("SELECT *  FROM t\nWHERE a = 'x' AND b = 10") == \
+                'SELECT * FROM t WHERE a = ? AND b = ?'
+        assert normalize('SELECT * FROM t WHERE id IN (?, ?, ?) LIMIT 1') == \
+                normalize('SELECT * FROM t WHERE id IN (?) LIMIT 5')
+
+    def test_profile(self):
+        with profile(n_plus_one=3) as p:
+            for pk in (1, 2, 3, 4):
+                self.db['artist'].get(pk)
+            [r for r in self.db['artist'].all()]
+        self.db['artist'].get(1)
+        assert p.count == 5
+        assert len(p.shapes) == 2
+        top = p.top()
+        gets = [s for s in top if s.count == 4][0]
+        assert gets.rows == 4
+        assert gets.percentile(50) <= gets.percentile(99)
+        assert p.n_plus_one_suspects() == [gets]
+        site, count, total = p.call_sites()[0]
+        assert site[0].startswith(__file__.rstrip('c'))
+        assert site[2] == 'test_profile'
+
+    def test_no_n_plus_one_for_repeats(self):
+        with profile(n_plus_one=3) as p:
+            for i in range(4):
+                self.db['artist'].get(1)
+        assert p.count == 4
+        assert p.n_plus_one_suspects() == []
+
+    def test_export(self):
+        with profile(adapter=self.db.adapter, n_plus_one=2) as p:
+            self.db['artist'].get(1)
+            self.db['artist'].get(2)
+        data = json.loads(p.to_json())
+        assert data['count'] == 2
+        assert data['n_plus_one'] == [data['shapes'][0]['shape']]
+        assert 'test_export' in data['call_sites'][0]['site']
+        text = p.to_text()
+        assert 'Possible N+1 queries' in text
+        assert data['shapes'][0]['shape'] in text
+        assert not self.db.adapter.hooks.active
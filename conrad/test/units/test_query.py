@@ -31,6 +31,12 @@ class TestQuery(object):
         assert q.statement.startswith('UPDATE')
         assert self.table.table_escaped in q.statement, q.statement
 
+    def test_update_returning(self):
+        q = Update(self.table, name='x').filter(id=1).returning()
+        assert q.statement.endswith('WHERE id = ? RETURNING *'), q.statement
+        q = Update(self.table, name='x').filter(id=1).returning('output')
+        assert 'SET name = ? OUTPUT INSERTED.* WHERE' in q.statement
+
     def test_delete(self):
         q = Delete(self.table)
         assert q.statement.startswith('DELETE FROM')
@@ -48,9 +54,35 @@ class TestQuery(object):
 
     def test_limit(self):
         q = Select(self.table).limit(5)
-        assert 'LIMIT 5' in q.statement
+        assert 'FETCH FIRST 5 ROWS ONLY' in q.statement
         q = Select(self.table).limit(lower=5, upper=10)
-        assert 'LIMIT 5 5' in q.statement
+        assert 'OFFSET 5 ROWS FETCH FIRST 5 ROWS ONLY' in q.statement
+
+    def test_statement_cache(self):
+        a = Select(self.table).filter(name='foo').statement
+        b = Select(self.table).filter(name='bar').statement
+        assert a is b
+        c = Select(self.table).filter(name=gt('foo')).statement
+        assert 'name > ?' in c
+        assert a is not c
+
+    def test_in(self):
+        q = Select(self.table).filter(id=in_([1, 2, 3]), name='foo')
+        assert 'id IN (?, ?, ?)' in q.statement
+        assert sorted(q.variables) == [1, 2, 3, 'foo']
+        assert '1 = 0' in Select(self.table).filter(id=in_([])).statement
+
+    def test_empty_in_per_column(self):
+        q = Select(self.table).filter(id=in_([]), name=in_([]))
+        q.filter(id=in_([1]))
+        assert 'id IN (?)' in q.statement
+        assert 'name IS NULL AND 1 = 0' in q.statement
+        assert q.variables == [1]
+
+    def test_batch(self):
+        q = Select(self.table).batch(50)
+        assert q.batch_size == 50
+        assert q.statement.startswith('SELECT * FROM')
 
     @raises(TypeError)
     def test_bad_limit(self):
@@ -87,6 +119,20 @@ class TestQuery(object):
         assert 'name = ?' in q.statement
         assert q.variables[0] == 'NO YUO'
 
+    def test_insert_many(self):
+        q = Insert(self.table).many([{'name': 'a', 'age': 1},
+                                     {'name': 'b', 'age': 2}])
+        assert q.statement.count('?') == 2
+        columns = [c.strip() for c in
+                   q.statement.split('(')[1].split(')')[0].split(',')]
+        assert q.variables == [tuple(row[c] for c in columns)
+                               for row in ({'name': 'a', 'age': 1},
+                                           {'name': 'b', 'age': 2})]
+
+    @raises(ValueError)
+    def test_insert_many_mismatched(self):
+        Insert(self.table).many([{'name': 'a'}, {'age': 2}])
+
     @raises(AttributeError)
     def test_insert_filter(self):
         q = Insert(self.table).filter(id=1)
@@ -0,0 +1,89 @@
+from nose.tools import raises
+
+from conrad.resource import Resource, RowLayout
+
+
+class MockTable(object):
+    pk_field = 'id'
+
+    def describe(self):
+        return {'id': {}, 'name': {}, 'age': {}}
+
+    columns = property(lambda self: self.describe().keys())
+
+
+class TestResource(object):
+
+    def setup(self):
+        self.table = MockTable()
+        self.layout = RowLayout(('id', 'name'))
+
+    def test_new(self):
+        r = Resource(self.table, {'name': 'foo'})
+        assert r.new
+        assert r['name'] == 'foo'
+        assert r.keys() == ['name']
+
+    def test_from_row(self):
+        r = Resource.from_row(self.table, self.layout, (1, 'foo'))
+        assert not r.new
+        assert r.pk == 1
+        assert r['name'] == 'foo'
+        assert r.attributes == {'id': 1, 'name': 'foo'}
+        assert not r.save_required
+
+    def test_shared_layout(self):
+        a = Resource.from_row(self.table, self.layout, (1, 'foo'))
+        b = Resource.from_row(self.table, self.layout, (2, 'bar'))
+        a['age'] = 30
+        assert a['age'] == 30
+        assert 'age' not in b
+        assert self.layout.names == ('id', 'name')
+
+    def test_dirty(self):
+        r = Resource.from_row(self.table, self.layout, (1, 'foo'))
+        r['name'] = 'bar'
+        assert r.save_required
+        assert r.dirty == {'name': 'bar'}
+        assert r['name'] == 'bar'
+        r.assign(id=2)
+        assert r.dirty == {'name': 'bar'}
+
+    @raises(KeyError)
+    def test_invalid_column(self):
+        r = Resource(self.table, {'name': 'foo'})
+        r['nope'] = 1
+
+    def test_equality(self):
+        r = Resource.from_row(self.table, self.layout, (1, 'foo'))
+        assert r == {'id': 1, 'name': 'foo'}
+        assert r != {'id': 2, 'name': 'foo'}
+
+    def test_no_instance_dict(self):
+        r = Resource.from_row(self.table, self.layout, (1, 'foo'))
+        assert not hasattr(r, '__dict__')
+        assert not hasattr(r.attributes, '__dict__')
+
+    @raises(TypeError)
+    def test_unhashable(self):
+        hash(Resource.from_row(self.table, self.layout, (1, 'foo')))
+
+    def test_mapping_api(self):
+        r = Resource.from_row(self.table, RowLayout(('id', 'name', 'age')),
+                              (1, 'foo', 30))
+        r['age'] = 31
+        assert r.pop('name') == 'foo'
+        assert r.keys() == ['id', 'age']
+        assert r.dirty == {'age': 31}
+        assert r.setdefault('age', 0) == 31
+        assert r.copy() == {'id': 1, 'age': 31}
+        assert r.pop('nope', None) is None
+        assert r.popitem() == ('id', 1)
+        r.clear()
+        assert r == {} and not r.dirty
+
+    def test_attributes_write_through(self):
+        r = Resource.from_row(self.table, self.layout, (1, 'foo'))
+        r.attributes['name'] = 'bar'
+        assert r['name'] == 'bar'
+        assert not r.save_required
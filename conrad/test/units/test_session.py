@@ -0,0 +1,65 @@
+import gc
+
+from conrad import session
+
+
+class MockTable(object):
+
+    def __init__(self, database, table):
+        self.database = database
+        self.table = table
+
+
+class MockResource(object):
+
+    def __init__(self, table, pk):
+        self.table = table
+        self.pk = pk
+
+
+class TestIdentityMap(object):
+
+    def setup(self):
+        self.map = session.IdentityMap()
+        self.db = object()
+        self.artist = MockTable(self.db, 'artist')
+
+    def test_add_get(self):
+        r = MockResource(self.artist, 1)
+        assert self.map.add(r) is r
+        assert self.map.get(self.artist, 1) is r
+        assert self.map.get(MockTable(self.db, 'album'), 1) is None
+
+    def test_add_existing(self):
+        r = MockResource(self.artist, 1)
+        self.map.add(r)
+        assert self.map.add(MockResource(self.artist, 1)) is r
+
+    def test_weak(self):
+        self.map.add(MockResource(self.artist, 1))
+        gc.collect()
+        assert self.map.get(self.artist, 1) is None
+
+    def test_remove(self):
+        r = MockResource(self.artist, 1)
+        self.map.add(r)
+        self.map.remove(r)
+        assert self.map.get(self.artist, 1) is None
+
+    def test_databases(self):
+        r = MockResource(self.artist, 1)
+        self.map.add(r)
+        assert self.map.get(MockTable(self.db, 'artist'), 1) is r
+        assert self.map.get(MockTable(object(), 'artist'), 1) is None
+
+
+class TestSession(object):
+
+    def test_current(self):
+        assert session.current() is None
+        with session.session() as outer:
+            assert session.current() is outer
+            with session.session() as inner:
+                assert session.current() is inner
+            assert session.current() is outer
+        assert session.current() is None
@@ -1,8 +1,13 @@
 import os
 
+from nose.tools import raises
+
 from conrad.test import resource, create_test_database
 from conrad import Database
 from conrad.table import Table
+from conrad.cache import ResultCache
+from conrad.resource import ResourceError
+from conrad.query import Insert, gt, lte, in_
 
 
 class TestTable(object):
@@ -26,4 +31,204 @@ class TestTable(object):
         assert 'name' in t.columns
         assert 'id' in t.columns
 
+    def test_bulk_create(self):
+        t = Table(self.db, 'artist')
+        before = len(t.all())
+        count = t.bulk_create([{'name': 'Band {}'.format(i)} for i in range(5)],
+                              batch_size=2)
+        assert count == 5
+        assert len(t.all()) == before + 5
+
+    def test_bulk_create_returning(self):
+        t = Table(self.db, 'artist')
+        created = t.bulk_create([{'name': 'Slint'}, {'name': 'Codeine'}],
+                                returning=True)
+        assert len(created) == 2
+        assert t.get(created[1].pk)['name'] == 'Codeine'
+
+    def test_bulk_create_multi_row(self):
+        t = self.db['artist']
+        self.db.adapter.dialect.insert_key_style = 'returning'
+        self.db.adapter.max_parameters = 2
+        statements = []
+        self.db.adapter.hooks.add('after_execute', statements.append)
+        created = t.bulk_create([{'name': n} for n in 'abcde'], returning=True)
+        assert len(statements) == 3
+        assert sorted(r['name'] for r in created) == list('abcde')
+        assert all(t.get(r.pk)['name'] == r['name'] for r in created)
+
+    @raises(ValueError)
+    def test_bulk_create_batch_size(self):
+        self.db['artist'].bulk_create([{'name': 'a'}], batch_size=0)
+
+    def test_get_in_session(self):
+        t = self.db['artist']
+        with self.db.session():
+            a = t.get(1)
+            assert t.get(1) is a
+            assert a in list(t.all())
+            assert [r for r in t.all() if r is a]
+        assert t.get(1) is not a
+
+    def test_projection_in_session(self):
+        t = self.db['artist']
+        with self.db.session():
+            names = [r['name'] for r in t.all().select('name')]
+            assert 'James Brown' in names
+            albums = self.db['album']
+            partial = list(albums.all().select('id', 'title'))
+            assert albums.get(1)['artist_id'] == 1
+
+    def test_seek(self):
+        t = self.db['artist']
+        assert [a.pk for a in t.all().seek(after=2).limit(1)] == [3]
+
+    def test_iter_chunks(self):
+        t = self.db['artist']
+        chunks = list(t.filter(name=gt('A')).iter_chunks(3))
+        assert [len(chunk) for chunk in chunks] == [3, 1]
+        assert [a.pk for chunk in chunks for a in chunk] == [1, 2, 3, 4]
+
+    def test_get_many(self):
+        self.db.adapter.max_parameters = 2
+        artists = self.db['artist'].get_many([1, 3, 4, 99])
+        assert sorted(artists) == [1, 3, 4]
+        assert artists[4]['name'] == 'Dinosaur Jr.'
+
+    def test_count(self):
+        t = self.db['artist']
+        assert t.all().count() == 4
+        assert len(t.filter(id=gt(2))) == 2
+        assert t.all().limit(3).count() == 3
+        assert t.filter(name='Fugazi').exists()
+        assert not t.filter(name='Nobody')
+
+    def test_list_one_statement(self):
+        statements = []
+        self.db.adapter.hooks.add('after_execute', statements.append)
+        q = self.db['artist'].all()
+        assert len(list(q)) == 4
+        assert len(q) == 4
+        assert len(statements) == 1
+        assert statements[0].statement.startswith('SELECT *')
+
+    def test_count_split_duplicates(self):
+        self.db.adapter.max_parameters = 2
+        q = self.db['artist'].filter(id=in_([1, 2, 1, 3, 2, 4]))
+        assert q.count() == 4
+
+    def test_values(self):
+        t = self.db['artist']
+        rows = list(t.filter(id=lte(2)).values('name'))
+        assert rows == [{'name': 'James Brown'}, {'name': 'Richard D. James'}]
+        assert list(t.filter(id=1).values_list('id', 'name')) == [(1, 'James Brown')]
+        assert list(t.filter(id=gt(3)).values_list('id', flat=True)) == [4]
+
+    def test_set_based_writes(self):
+        albums = self.db['album']
+        assert albums.filter(artist_id=3).update(artist_id=4) == 2
+        assert albums.filter(artist_id=4).count() == 3
+        assert albums.filter(artist_id=4).delete() == 3
+        assert albums.all().count() == 2
+
+    def test_split_write_atomic(self):
+        t = self.db['artist']
+        self.db.adapter.max_parameters = 2
+        try:
+            # The second chunk collides with the row the first one moved.
+            t.filter(id=in_([1, 4])).update(id=5)
+            assert False, 'update should have raised'
+        except Exception, e:
+            assert not isinstance(e, AssertionError)
+        assert t.get(1)['name'] == 'James Brown'
+        assert t.get(5) is None
+
+    def test_create_in_one_statement(self):
+        self.db.adapter.dialect.insert_key_style = 'returning'
+        t = self.db['artist']
+        q = Insert(t).set(name='Shellac')
+        assert q.execute() == 5
+        assert q.row is not None
+        assert t.create(name='Slint').attributes == {'id': 6, 'name': 'Slint'}
+
+    def test_save_modes(self):
+        t = self.db['artist']
+        artist = t.get(1)
+        artist['name'] = 'JB'
+        assert artist.save(mode='trust')['name'] == 'JB'
+        assert not artist.save_required
+        assert t.get(1)['name'] == 'JB'
+        self.db.adapter.dialect.returning_style = 'returning'
+        artist['name'] = 'James Brown'
+        artist.save(mode='returning')
+        assert artist.attributes == {'id': 1, 'name': 'James Brown'}
+
+    @raises(ResourceError)
+    def test_trusted_save_of_missing_row(self):
+        artist = self.db['artist'].get(1)
+        self.db.adapter.execute('DELETE FROM artist WHERE id = 1')
+        artist['name'] = 'JB'
+        try:
+            artist.save(mode='trust')
+        finally:
+            assert artist.save_required
+
+    def test_related(self):
+        fugazi = self.db['artist'].get(3)
+        titles = sorted(a['title'] for a in fugazi.related('albums'))
+        assert titles == ['13 Songs', 'Instrument']
+        assert self.db['album'].get(1).related('artist')['name'] == 'James Brown'
+
+    def test_prefetch(self):
+        statements = []
+        self.db.adapter.hooks.add('after_execute', statements.append)
+        albums = [a for a in self.db['album'].all().prefetch('artist').batch(2)]
+        # The albums, then one artist query per batch of two albums.
+        assert len(statements) == 4
+        assert [a.related('artist').pk for a in albums] == [1, 2, 3, 3, 4]
+        assert len(statements) == 4
+
+    def test_result_cache(self):
+        self.db.adapter.result_cache = ResultCache()
+        t = self.db['artist']
+        assert len(t.all()) == 4
+        assert len(t.all()) == 4
+        assert self.db.adapter.result_cache.hits == 1
+        t.create(name='Shellac')
+        assert len(t.all()) == 5
+
+    def test_result_cache_max_rows(self):
+        cache = self.db.adapter.result_cache = ResultCache(max_rows=2)
+        assert len([a for a in self.db['artist'].all()]) == 4
+        assert len(cache) == 0
+        assert len([a for a in self.db['artist'].filter(id=1)]) == 1
+        assert len(cache) == 1
+
+    def test_result_cache_adapter_writes(self):
+        cache = self.db.adapter.result_cache = ResultCache()
+        t = self.db['artist']
+        assert len([a for a in t.all()]) == 4
+        self.db.adapter.execute('INSERT INTO artist (name) VALUES (?)', 'Low')
+        assert len(cache) == 0
+        assert len([a for a in t.all()]) == 5
+        with self.db.adapter.transaction():
+            self.db.adapter.delete('artist', {'name': 'Low'})
+            assert len(cache) == 1
+        assert len(cache) == 0
+        assert len([a for a in t.all()]) == 4
+
+    def test_reload_skips_result_cache(self):
+        cache = self.db.adapter.result_cache = ResultCache()
+        artist = self.db['artist'].get(1)
+        with self.db.adapter.checkout() as connection:
+            connection.cursor().execute(
+                    "UPDATE artist SET name = 'Low' WHERE id = 1")
+            connection.commit()
+        assert self.db['artist'].get(1)['name'] == 'James Brown'
+        assert artist.reload()['name'] == 'Low'
 
+    def test_aget(self):
+        future = self.db['artist'].aget(1)
+        assert future.result(5)['name'] == 'James Brown'
+        future = self.db['artist'].all().afetch()
+        assert len(future.result(5)) == 4